@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 #=========================================================================================
 # lib_general.py
-# V.1.0.0
+# V.1.16.10
 # N. Edwin Widjonarko
 #
 # Python functions that I've found useful
@@ -34,12 +34,18 @@
 #=========================================================================================
 
 import os, sys
+import io
+import re
+import struct
+import collections
 import platform
 import getpass
 import socket
 import shutil
 import glob
 import subprocess
+import shlex
+import json
 import logging
 import logging.config
 import yaml
@@ -145,61 +151,343 @@ def chk_mkdir(dirpath):
 	return os.path.abspath(dirpath)
 
 
-def enumfn(filepath, startinc=0):
+def enumfn(filepath, startinc=0, method='linear'):
 	''' enumerate file name with "_n" and auto-increment as necessary
 		Note that this function only works on the file name string and does not actually 
-		change the file name on disk.
+		change the file name on disk. See enumfn_reserve() to also create the file.
 
 	--- inputs:
 	* filepath 		: String representation of the file path. Will be parsed to get base file name, 
 						extension, and directory name
 	* OPT: startinc : starting enumeration
+	* OPT: method 	: how to find the free n:
+						'linear' = first free n from startinc, one stat per n
+						'probe'  = exponential then binary search, O(log n) stats. Returns
+									the n after the run of existing names from startinc 
+									(same as 'linear' when there is no gap in the numbers)
+						'scan'   = one os.scandir of the directory: highest existing n + 1
 
 	--- return:
 	* new file name with "_n" suffix
 	'''
+	return _enumfn(filepath, startinc, method)[1]
+
+
+def _enumfn(filepath, startinc=0, method='linear'):
+	''' enumfn(), return (n, new file name) '''
+	if not method in ['linear', 'probe', 'scan']:
+		raise ValueError('Valid choice for method are: "linear", "probe", or "scan"')
 	basedir = os.path.dirname(filepath)
 	basename = os.path.basename(filepath)
 	ext = os.path.splitext(basename)[1]
 	basename = os.path.splitext(basename)[0]
 
+	def enum_name(n):
+		return os.path.join(basedir, (basename + '_' + str(n) + ext))
+
 	auto_inc = startinc
-	filename = os.path.join(basedir, (basename + '_' + str(auto_inc) + ext))
-	while(os.path.exists(filename)):
+	if method=='scan':
+		pattern = re.compile(re.escape(basename) + r'_(\d+)' + re.escape(ext) + '$')
+		with os.scandir(basedir or '.') as it:
+			for entry in it:
+				m = pattern.match(entry.name)
+				if m:
+					auto_inc = max(auto_inc, int(m.group(1)) + 1)
+	elif method=='probe' and os.path.lexists(enum_name(auto_inc)):
+		lo, step = auto_inc, 1 		# lo exists
+		while os.path.lexists(enum_name(lo + step)):
+			lo, step = lo + step, step * 2
+		hi = lo + step 				# hi does not exist
+		while hi - lo > 1:
+			mid = (lo + hi) // 2
+			if os.path.lexists(enum_name(mid)):
+				lo = mid
+			else:
+				hi = mid
+		auto_inc = hi
+	while(os.path.exists(enum_name(auto_inc))):
 		auto_inc += 1
-		filename = os.path.join(basedir, (basename + '_' + str(auto_inc) + ext))
 
-	return filename
+	return auto_inc, enum_name(auto_inc)
+
+
+def enumfn_reserve(filepath, startinc=0, method='probe', max_tries=1000):
+	''' enumfn() and create the (empty) file atomically (O_CREAT | O_EXCL), so that 
+		concurrent workers (threads, processes, hosts on the same NFSv3+ share) each get a 
+		unique name. On a race, the search restarts after the name that was taken.
 
+	--- inputs:
+	* filepath 		: file path to enumerate, see enumfn()
+	* OPT: startinc : starting enumeration
+	* OPT: method 	: see enumfn(). 'probe' (default) costs O(log n) stats
+	* OPT: max_tries : give up (FileExistsError) after this many races lost
 
-def copytree(src, dst, symlink=False, ignore=None):
-	''' a wrapper for shutil copytree and copy2 to mimic bash copy, i.e. this
-		will take both file and directory as src
+	--- return:
+	* new file name with "_n" suffix. The file exists and is empty
+	'''
+	for _ in range(max_tries):
+		n, filename = _enumfn(filepath, startinc, method)
+		try:
+			fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+		except FileExistsError:
+			startinc = n + 1
+			continue
+		os.close(fd)
+		return filename
+	raise FileExistsError('enumfn_reserve: no free name for %s after %d tries' %(filepath, max_tries))
+
+
+def copytree(src, dst, symlink=False, ignore=None, n_jobs=8, sync=False, delete=False, checksum=True,
+			manifest=''):
+	''' mimic bash copy, i.e. this will take both file and directory as src. 
+	* src file: copied to dst, or into dst if dst is a directory
+	* src directory: its content is copied into dst (created if needed)
+	* The tree is walked with os.scandir and the files are copied concurrently by a 
+		thread pool, in the kernel when possible (copy_file_range / sendfile), with 
+		their metadata (as shutil.copy2). Directory metadata is set once their content
+		is copied
+	* An error on a file or directory is logged and reported, the rest is still copied
+	* Special files (fifo, socket, device) are not copied, they are reported as errors
+	* sync=True (directory src): incremental copy against a manifest kept in dst of what 
+		was copied (path, size, mtime, content hash). Only new or changed files are 
+		copied. Same size, other mtime is ambiguous: with checksum, a file of 1 MB or 
+		more is hashed (in the pool) and copied only if the content differs. dst is 
+		assumed not modified by others: a file changed or removed in dst is not copied 
+		again while its source is unchanged (sync=False copies everything)
 
 	--- inputs:
 	* src 		: source directory or file
 	* dst 		: destination path
-	* OPT: synmlink : If True, symbolic links in the source tree are represented as symbolic links 
+	* OPT: symlink 	: If True, symbolic links in the source tree are represented as symbolic links 
 						in the new tree, but the metadata of the original links is NOT copied; if 
 						False or omitted, the contents and metadata of the linked files are copied 
 						to the new tree
 	* OPT: ignore 	: is a callable defining items to ignore. See shutil documentation for more info
+	* OPT: n_jobs 	: number of files copied at the same time
+	* OPT: sync 	: if True, only copy new or changed files (see above)
+	* OPT: delete 	: sync only. Delete from dst what was copied before and is no longer in
+						src (ignored paths and directories that cannot be listed are kept)
+	* OPT: checksum : sync only. Hash ambiguous large files instead of copying them
+	* OPT: manifest : sync only. Manifest file (SQLite) path (default = 
+						dst/.copytree_manifest.sqlite)
 
 	--- return:
-	* NONE
+	* dict: 'files' (number copied), 'bytes', 'seconds', 'MB/s', 'errors' (list of 
+		(src path, dst path, error message)). sync: also 'skipped' (unchanged files) and
+		'deleted'
 	'''
-	for item in os.listdir(src):
-		s = os.path.listdir(src, item)
-		d = os.path.listdir(dst, item)
-		if os.path.isdir(s):
-			shutil.copytree(s, d, symlink, ignore)
+	import time
+	import concurrent.futures as cf
+
+	t0 = time.time()
+	report = {'files' : 0, 'bytes' : 0, 'errors' : []}
+
+	def error(s, d, e):
+		logger.warning('copytree: %s -> %s: %s' %(s, d, e))
+		report['errors'].append((s, d, str(e)))
+
+	def copy_done(get_result, s, d, rel=None, row=None):
+		try:
+			if rel is None:
+				report['bytes'] += get_result()
+				report['files'] += 1
+				return
+			n_bytes, digest = get_result()
+		except (OSError, shutil.Error) as e:
+			error(s, d, e)
+			return
+		if n_bytes is None: 	# same content
+			report['skipped'] += 1
 		else:
-			shutil.copy2(s, d)
+			report['bytes'] += n_bytes
+			report['files'] += 1
+		updates[rel] = row + (digest,)
+
+	if not os.path.isdir(src):
+		if sync:
+			raise ValueError('sync needs a source directory, got %s' %src)
+		if os.path.isdir(dst):
+			dst = os.path.join(dst, os.path.basename(src))
+		copy_done(lambda: _copy_file(src, dst, symlink), src, dst)
+	else:
+		if sync:
+			os.makedirs(dst, exist_ok=True)
+			if manifest=='':
+				manifest = os.path.join(dst, '.copytree_manifest.sqlite')
+			db, copied = _load_manifest(manifest)
+			updates = {} 		# rel path: (type, size, mtime_ns, hash)
+			kept = [] 			# rel dirs whose content is not walked: never deleted
+			report['skipped'] = 0
+			report['deleted'] = 0
+
+		dirs = [] 	# (src, dst) in walk order, for their metadata at the end
+		with cf.ThreadPoolExecutor(max_workers=n_jobs) as pool:
+			running = {}
+			stack = [(src, dst)]
+			while stack:
+				s_dir, d_dir = stack.pop()
+				rel_dir = os.path.relpath(s_dir, src)
+				try:
+					entries = list(os.scandir(s_dir))
+					os.makedirs(d_dir, exist_ok=True)
+				except OSError as e:
+					error(s_dir, d_dir, e)
+					if sync:
+						kept.append(rel_dir)
+					continue
+				dirs.append((s_dir, d_dir))
+				if sync and rel_dir!='.' and copied.pop(rel_dir, None) is None:
+					updates[rel_dir] = ('d', 0, 0, None)
+				ignored = ignore(s_dir, [e.name for e in entries]) if ignore is not None else ()
+				for entry in entries:
+					rel = os.path.normpath(os.path.join(rel_dir, entry.name))
+					if entry.name in ignored:
+						if sync:
+							kept.append(rel)
+						continue
+					d = os.path.join(d_dir, entry.name)
+					try:
+						is_dir = entry.is_dir(follow_symlinks=not symlink)
+					except OSError:
+						is_dir = False
+					if is_dir:
+						stack.append((entry.path, d))
+						continue
+					if len(running) >= 4 * n_jobs:
+						done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+						for future in done:
+							copy_done(future.result, *running.pop(future))
+					if not sync:
+						running[pool.submit(_copy_file, entry.path, d, symlink)] = (entry.path, d)
+						continue
+
+					try:
+						st = entry.stat(follow_symlinks=not symlink)
+					except OSError as e:
+						error(entry.path, d, e)
+						kept.append(rel)
+						continue
+					row = ('l' if entry.is_symlink() and symlink else 'f', st.st_size, st.st_mtime_ns)
+					old = copied.pop(rel, None)
+					if old is not None and old[:3]==row:
+						report['skipped'] += 1
+						continue
+					future = pool.submit(_sync_file, entry.path, d, symlink, row, old, checksum)
+					running[future] = (entry.path, d, rel, row)
+			for future in cf.as_completed(running):
+				copy_done(future.result, *running[future])
+
+		if sync and delete:
+			for rel in sorted(copied, reverse=True): 	# files before their directory
+				if any(rel==k or rel.startswith(k + os.sep) for k in kept):
+					continue
+				d = os.path.join(dst, rel)
+				try:
+					if copied[rel][0]=='d':
+						os.rmdir(d)
+					elif os.path.lexists(d):
+						os.remove(d)
+					updates[rel] = None
+					report['deleted'] += 1
+				except OSError as e:
+					error(os.path.join(src, rel), d, e)
+
+		for s_dir, d_dir in reversed(dirs): 	# children first: copying them touches the parent
+			try:
+				shutil.copystat(s_dir, d_dir)
+			except OSError as e:
+				error(s_dir, d_dir, e)
+
+		if sync:
+			_save_manifest(db, updates)
+
+	report['seconds'] = time.time() - t0
+	report['MB/s'] = report['bytes'] / 1e6 / report['seconds'] if report['seconds'] > 0 else 0.
+	logger.info('copytree %s -> %s: %d files, %.1f MB, %.1f MB/s, %d errors' %(src, dst, report['files'],
+		report['bytes'] / 1e6, report['MB/s'], len(report['errors'])))
+	return report
+
+
+def _copy_file(src, dst, symlink=False):
+	''' copytree(): copy one file with its metadata (shutil.copy2), the data by the kernel
+		if possible. Return the number of bytes copied. A special file (fifo, socket, 
+		device) raises shutil.SpecialFileError, as shutil does, instead of blocking '''
+	import stat
+
+	if symlink and os.path.islink(src):
+		if os.path.lexists(dst):
+			os.remove(dst)
+		os.symlink(os.readlink(src), dst)
+		return 0
+	if not stat.S_ISREG(os.stat(src).st_mode):
+		raise shutil.SpecialFileError('`%s` is not a regular file (fifo, socket or device)' %src)
+	with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+		size = os.fstat(f_in.fileno()).st_size
+		_copy_fd_range(f_in.fileno(), f_out.fileno(), 0, size)
+	shutil.copystat(src, dst)
+	return size
+
+
+# ---- copytree sync manifest ----
+# one row per path copied, relative to src: type ('f', 'l' = symlink, 'd'), size and 
+# mtime_ns of the source when copied, content hash (only computed for ambiguous files)
+_SYNC_HASH_MIN = 1048576 		# smaller files are copied rather than hashed
+
+
+def _sync_file(src, dst, symlink, row, old, checksum):
+	''' copytree(sync=True): copy one new or changed file. Same type and size as in the 
+		manifest (old) but another mtime: hash it and copy only if the content differs.
+		Return (bytes copied or None if not copied, content hash or None) '''
+	typ, size, mtime_ns = row
+	digest = None
+	if (checksum and old is not None and typ=='f' and old[0]=='f' and old[1]==size
+			and size >= _SYNC_HASH_MIN and os.path.isfile(dst)):
+		digest = _hash_file(src)
+		if digest==(old[3] or _hash_file(dst)):
+			shutil.copystat(src, dst)
+			return None, digest
+	return _copy_file(src, dst, symlink), digest
+
+
+def _hash_file(filepath, bufsize=1048576):
+	''' blake2b hex digest of a file, read with a reusable buffer '''
+	import hashlib
+
+	h = hashlib.blake2b()
+	buf = bytearray(bufsize)
+	view = memoryview(buf)
+	with open(filepath, 'rb', buffering=0) as f:
+		while True:
+			n = f.readinto(view)
+			if not n:
+				break
+			h.update(view[:n])
+	return h.hexdigest()
+
+
+def _load_manifest(manifest):
+	''' copytree(sync=True): open the manifest, return (db connection, {rel path: row}) '''
+	import sqlite3
+
+	db = sqlite3.connect(manifest)
+	db.execute('''CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, type TEXT,
+		size INTEGER, mtime_ns INTEGER, hash TEXT)''')
+	copied = {r[0] : r[1:] for r in db.execute('SELECT path, type, size, mtime_ns, hash FROM files')}
+	return db, copied
+
+
+def _save_manifest(db, updates):
+	''' copytree(sync=True): write the changed rows (None = deleted) and close '''
+	with db:
+		db.executemany('DELETE FROM files WHERE path=?', [(p,) for p, r in updates.items() if r is None])
+		db.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?)',
+			[(p,) + r for p, r in updates.items() if r is not None])
+	db.close()
 
 
 def searchpath(indir, incRegex, excRegex='', fileOrDir='df'):
 	''' Search for file or directory names satisfying incRegex, and excluding those that satisfy
-		excRegex.
+		excRegex. Only indir itself is listed, see searchpath_iter() for a recursive search.
 
 	--- inputs:
 	* indir			: parent directory under which to do the search
@@ -212,100 +500,969 @@ def searchpath(indir, incRegex, excRegex='', fileOrDir='df'):
 	--- return:
 	* list of path names
 	'''
+	return list(searchpath_iter(indir, incRegex, excRegex, fileOrDir, recursive=False))
+
+
+def searchpath_iter(indir, incRegex='', excRegex='', fileOrDir='df', recursive=True, n_jobs=1,
+					followlinks=False):
+	''' Recursive, streaming searchpath(): yield file or directory paths whose name satisfies
+		incRegex and not excRegex, while walking the tree.
+	* Based on os.scandir: the file type comes from the directory entry (d_type), so 
+		there is no stat per entry (except for symlinks)
+	* The regexes are compiled once and matched against the entry name, as searchpath()
+	* An excluded directory is not descended into (pruned), incRegex does not prune
+	* n_jobs > 1 lists the directories with a thread pool, to hide the latency of 
+		network file systems (NFS). The order of the paths is then not deterministic
+	* Directories that cannot be listed (e.g. no permission) are logged and skipped
+
+	--- inputs:
+	* indir			: top directory of the search
+	* OPT: incRegex	: regex string pattern for the matching name. Empty string = include all
+	* OPT: excRegex : regex string pattern to exclude. Empty string = no exclusion
+	* OPT: fileOrDir: 'f'  = only return files
+					  'd'  = only return directories
+					  'fd' or 'df' = return file and directory names
+	* OPT: recursive: if False, only list indir
+	* OPT: n_jobs 	: number of threads listing directories
+	* OPT: followlinks : if True, descend into symlinks to directories (beware of loops)
+
+	--- return:
+	* yield path names
+	'''
 	if not fileOrDir in ['f', 'd', 'fd', 'df']:
 		raise ValueError('Valid choice for fileOrDir are: "f", "d", "fd", or "df"')
 
-	all_paths = os.listdir(indir)
-	list_path = []
-
-	for path in all_paths:
-		pass_fileDir = True
-		pass_regex = False
-
-		# file or dir or both
-		if fileOrDir=='f':
-			pass_fileDir = os.path.isfile( os.path.join(indir, path) )
-		elif fileOrDir=='d':
-			pass_fileDir = os.path.isdir( os.path.join(indir, path) )
-
-		# evaluate regex
-		if incRegex is not '':
-			if re.search(incRegex, path):
-				if excRegex is not '':
-					if not re.search(excRegex, path):
-						pass_regex = True
-				else:
-					pass_regex = True
-		else:
-			pass_regex = True
+	inc = re.compile(incRegex) if incRegex!='' else None
+	exc = re.compile(excRegex) if excRegex!='' else None
+	args = (inc, exc, 'f' in fileOrDir, 'd' in fileOrDir, recursive, followlinks)
+
+	if n_jobs <= 1:
+		stack = [indir]
+		while stack:
+			paths, subdirs = _scan_dir(stack.pop(), *args)
+			for path in paths:
+				yield path
+			stack.extend(reversed(subdirs))
+		return
+
+	import concurrent.futures as cf
+
+	pending = collections.deque([indir])
+	with cf.ThreadPoolExecutor(max_workers=n_jobs) as pool:
+		running = set()
+		try:
+			while pending or running:
+				while pending and len(running) < 4 * n_jobs:
+					running.add(pool.submit(_scan_dir, pending.popleft(), *args))
+				done, running = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+				for future in done:
+					paths, subdirs = future.result()
+					pending.extend(subdirs)
+					for path in paths:
+						yield path
+		finally:
+			for future in running:
+				future.cancel()
+
+
+def _scan_dir(dirpath, inc, exc, want_f, want_d, recursive, followlinks):
+	''' searchpath_iter(): list one directory, return (matching paths, subdirs to walk) '''
+	paths = []
+	subdirs = []
+	try:
+		with os.scandir(dirpath) as it:
+			for entry in it:
+				name = entry.name
+				if exc is not None and exc.search(name):
+					continue
+				try:
+					is_dir = entry.is_dir()
+				except OSError:
+					is_dir = False
+				if (want_d if is_dir else want_f and entry.is_file()) and (inc is None or inc.search(name)):
+					paths.append(entry.path)
+				if recursive and is_dir and (followlinks or not entry.is_symlink()):
+					subdirs.append(entry.path)
+	except OSError as e:
+		logger.warning('searchpath: cannot list %s: %s' %(dirpath, e))
+	return paths, subdirs
+
+
+def grep_files(paths, pattern, n_jobs=1, processes=False, first_only=False, max_total=None,
+				flags=0):
+	''' Search the content of files (e.g. the output of searchpath_iter()) with a regex,
+		like grep. Each file is memory-mapped and searched as bytes: never read into a 
+		python string.
+	* Binary files (a NUL byte in the first 8 kB, as grep) and empty files are skipped
+	* n_jobs > 1 searches the files concurrently: threads by default (hides the file 
+		system latency, but re does not release the GIL), processes=True for CPU-bound
+		searches. Results come per file, in the order the files finish
+	* Stopping the loop early cancels the files not searched yet
+
+	--- inputs:
+	* paths 		: iterable of file paths, consumed lazily
+	* pattern 		: regex, str / bytes / compiled bytes pattern. A str is utf-8 encoded
+	* OPT: n_jobs 	: number of files searched at the same time
+	* OPT: processes : if True, use a process pool instead of threads
+	* OPT: first_only : only the first match of each file
+	* OPT: max_total : stop after this many matches in total
+	* OPT: flags 	: re flags, e.g. re.IGNORECASE | re.MULTILINE
+
+	--- return:
+	* yield (path, line number (1-based) of the match start, matched bytes)
+	'''
+	if isinstance(pattern, str):
+		pattern = pattern.encode('utf-8')
+	if not isinstance(pattern, bytes): 	# compiled
+		pattern, flags = pattern.pattern, pattern.flags | flags
+		if isinstance(pattern, str):
+			raise TypeError('Compiled pattern must be a bytes pattern')
+	max_file = 1 if first_only else max_total
+	n_total = 0
+
+	if n_jobs <= 1:
+		regex = re.compile(pattern, flags)
+		for path in paths:
+			for match in _grep_file(path, regex, max_file):
+				yield match
+				n_total += 1
+				if max_total is not None and n_total >= max_total:
+					return
+		return
+
+	import itertools
+	import concurrent.futures as cf
+
+	PoolExecutor = cf.ProcessPoolExecutor if processes else cf.ThreadPoolExecutor
+	paths = iter(paths)
+	with PoolExecutor(max_workers=n_jobs) as pool:
+		running = set()
+		try:
+			while True:
+				for path in itertools.islice(paths, 4 * n_jobs - len(running)):
+					running.add(pool.submit(_grep_file, path, (pattern, flags), max_file))
+				if not running:
+					break
+				done, running = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+				for future in done:
+					for match in future.result():
+						yield match
+						n_total += 1
+						if max_total is not None and n_total >= max_total:
+							return
+		finally:
+			for future in running:
+				future.cancel()
+
+
+def _grep_file(path, regex, max_matches=None, bufsize=1048576):
+	''' grep_files(): list of (path, line number, match) of one file. regex = compiled
+		pattern or (pattern, flags) '''
+	import mmap
+
+	if isinstance(regex, tuple):
+		regex = re.compile(*regex)
+	matches = []
+	try:
+		with open(path, 'rb') as f:
+			if b'\0' in f.read(8192):
+				return matches
+			if os.fstat(f.fileno()).st_size == 0:
+				return matches
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+				lineno, pos = 1, 0
+				for m in regex.finditer(mm):
+					start = m.start()
+					while pos < start: 	# count line ends in slices, never the whole file
+						end = min(start, pos + bufsize)
+						lineno += mm[pos:end].count(b'\n')
+						pos = end
+					matches.append((path, lineno, m.group()))
+					if max_matches is not None and len(matches) >= max_matches:
+						break
+	except OSError as e:
+		logger.warning('grep_files: cannot read %s: %s' %(path, e))
+	return matches
+
+
+class PathIndex(object):
+	''' On-disk snapshot of a directory tree (SQLite): path, type, size and mtime of every
+		entry, for repeated searchpath() style queries without walking the file system.
+	* refresh() is incremental: every directory is stat-ed, but only those whose mtime 
+		changed (entries added, removed, renamed) are listed again. Size and mtime of a 
+		file rewritten in place are updated by refresh(full=True) only, as that does not
+		change the directory mtime
+	* search() runs the regexes in memory against the snapshot, loaded once
+	* Symlinks are indexed with the type of their target, and not descended into
 
-		if pass_fileDir and pass_regex:
-			list_path.append( os.path.join(indir, path) )
+	--- inputs:
+	* indir 		: top directory of the index
+	* OPT: dbpath 	: SQLite file (default = indir + '.pathidx.sqlite', next to indir)
+	* OPT: refresh 	: if True, refresh() right away
+
+	EXAMPLE:
+		* pidx = PathIndex('/nfs/models')
+		* pidx.search('[.]csv$', 'tmp', 'f')
+		* (next job) PathIndex('/nfs/models').search(...)
+	'''
+	def __init__(self, indir, dbpath='', refresh=True):
+		import sqlite3
+
+		self.indir = os.path.abspath(indir)
+		if dbpath=='':
+			dbpath = self.indir.rstrip(os.sep) + '.pathidx.sqlite'
+		self.dbpath = dbpath
+		self._db = sqlite3.connect(dbpath)
+		self._db.executescript('''
+			CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+			CREATE TABLE IF NOT EXISTS entries (dir TEXT, name TEXT, type TEXT, islink INTEGER,
+				size INTEGER, mtime_ns INTEGER, PRIMARY KEY (dir, name));
+		''')
+		self._snapshot = None
+		if refresh:
+			self.refresh()
+
+	def close(self):
+		self._db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def refresh(self, full=False):
+		''' update the snapshot, return the number of directories listed again '''
+		db = self._db
+		known = dict(db.execute('SELECT path, mtime_ns FROM dirs'))
+		seen = set()
+		n_scanned = 0
+		stack = [self.indir]
+		with db:
+			while stack:
+				dirpath = stack.pop()
+				try:
+					mtime_ns = os.stat(dirpath).st_mtime_ns
+				except OSError:
+					continue
+				seen.add(dirpath)
+				if not full and known.get(dirpath)==mtime_ns:
+					stack.extend(os.path.join(dirpath, name) for (name,) in db.execute(
+						"SELECT name FROM entries WHERE dir=? AND type='d' AND islink=0", (dirpath,)))
+					continue
+				rows = _scan_dir_stat(dirpath)
+				n_scanned += 1
+				db.execute('DELETE FROM entries WHERE dir=?', (dirpath,))
+				db.executemany('INSERT INTO entries VALUES (?,?,?,?,?,?)', [(dirpath,) + r for r in rows])
+				db.execute('INSERT OR REPLACE INTO dirs VALUES (?,?)', (dirpath, mtime_ns))
+				stack.extend(os.path.join(dirpath, r[0]) for r in rows if r[1]=='d' and not r[2])
+
+			gone = [(path,) for path in known if path not in seen]
+			db.executemany('DELETE FROM entries WHERE dir=?', gone)
+			db.executemany('DELETE FROM dirs WHERE path=?', gone)
+		self._snapshot = None
+		return n_scanned
+
+	def _load(self):
+		''' snapshot in memory: {dir: [(name, type)]} '''
+		if self._snapshot is None:
+			snapshot = {}
+			for dirpath, name, typ in self._db.execute('SELECT dir, name, type FROM entries'):
+				snapshot.setdefault(dirpath, []).append((name, typ))
+			self._snapshot = snapshot
+		return self._snapshot
+
+	def search(self, incRegex='', excRegex='', fileOrDir='df', subdir=''):
+		''' searchpath_iter() against the snapshot (same matching and pruning rules)
+
+		--- inputs:
+		* OPT: incRegex	: regex string pattern for the matching name. Empty string = include all
+		* OPT: excRegex : regex string pattern to exclude. Empty string = no exclusion
+		* OPT: fileOrDir: 'f', 'd', 'fd' or 'df', see searchpath()
+		* OPT: subdir 	: only search under this directory of the index. A relative path is
+							relative to the index top directory
+
+		--- return:
+		* list of path names
+		'''
+		if not fileOrDir in ['f', 'd', 'fd', 'df']:
+			raise ValueError('Valid choice for fileOrDir are: "f", "d", "fd", or "df"')
+		inc = re.compile(incRegex) if incRegex!='' else None
+		exc = re.compile(excRegex) if excRegex!='' else None
+		want = set(fileOrDir)
+
+		snapshot = self._load()
+		top = os.path.abspath(os.path.join(self.indir, subdir)) if subdir!='' else self.indir
+		list_path = []
+		stack = [top]
+		while stack:
+			dirpath = stack.pop()
+			for name, typ in snapshot.get(dirpath, ()):
+				if exc is not None and exc.search(name):
+					continue
+				path = os.path.join(dirpath, name)
+				if typ in want and (inc is None or inc.search(name)):
+					list_path.append(path)
+				if typ=='d' and path in snapshot:
+					stack.append(path)
+		return list_path
+
+	def stat(self, path):
+		''' (type, size, mtime_ns) of path (absolute, or relative to the index top directory)
+			from the snapshot, None if not indexed '''
+		path = os.path.abspath(os.path.join(self.indir, path))
+		return self._db.execute('SELECT type, size, mtime_ns FROM entries WHERE dir=? AND name=?',
+			(os.path.dirname(path), os.path.basename(path))).fetchone()
+
+
+def _scan_dir_stat(dirpath):
+	''' PathIndex: list one directory, return [(name, type, islink, size, mtime_ns)] '''
+	rows = []
+	try:
+		with os.scandir(dirpath) as it:
+			for entry in it:
+				try:
+					islink = entry.is_symlink()
+					st = entry.stat(follow_symlinks=True)
+					typ = 'd' if entry.is_dir() else 'f' if entry.is_file() else 'o'
+				except OSError: 	# e.g. dangling symlink
+					st = entry.stat(follow_symlinks=False)
+					typ = 'o'
+				rows.append((entry.name, typ, int(islink), st.st_size, st.st_mtime_ns))
+	except OSError as e:
+		logger.warning('PathIndex: cannot list %s: %s' %(dirpath, e))
+	return rows
+
+
+# ---- compressed files ----
+_COMPRESSION_EXT = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.lzma': 'xz'}
+# full magic, so that a text file starting with e.g. "BZh" is not taken as compressed:
+# gzip + deflate method, bz2 + block size + block (or end of stream) magic, xz
+_COMPRESSION_MAGIC = [	(re.compile(b'\x1f\x8b\x08'), 'gzip'),
+						(re.compile(b'BZh[1-9](1AY&SY|\x17rE8P\x90)'), 'bz2'),
+						(re.compile(b'\xfd7zXZ\x00'), 'xz') ]
+
+
+def get_compression(filepath):
+	''' Detect the compression of a file from its extension (.gz, .bz2, .xz, .lzma), or
+		from its first bytes if the file exists and the extension is not one of them
 
+	--- inputs:
+	* filepath		: file path
 
-def filelen(filepath):
+	--- return:
+	* 'gzip', 'bz2', 'xz', or None (not compressed)
+	'''
+	ext = os.path.splitext(str(filepath))[1].lower()
+	if ext in _COMPRESSION_EXT:
+		return _COMPRESSION_EXT[ext]
+	if os.path.isfile(filepath):
+		with open(filepath, 'rb') as f:
+			magic = f.read(10)
+		for pattern, compression in _COMPRESSION_MAGIC:
+			if pattern.match(magic):
+				return compression
+	return None
+
+
+def open_file(filepath, mode='rb', compression='infer', **kwargs):
+	''' open() that transparently (de)compresses gzip / bz2 / xz files with the stdlib codecs
+
+	--- inputs:
+	* filepath 			: file path
+	* OPT: mode 		: as open(), e.g. 'rb', 'wb', 'rt' (default = 'rb')
+	* OPT: compression 	: 'infer' = from the extension, or from the first bytes when reading
+						  None = plain file
+						  'gzip', 'bz2', or 'xz'
+	* OPT: kwargs 		: other arguments for the open function, e.g. encoding
+
+	--- return:
+	* file object
+	'''
+	import gzip, bz2, lzma
+
+	if compression=='infer':
+		if 'r' in mode:
+			compression = get_compression(filepath)
+		else:
+			compression = _COMPRESSION_EXT.get(os.path.splitext(str(filepath))[1].lower())
+	if compression is None:
+		return open(filepath, mode, **kwargs)
+	if not compression in ['gzip', 'bz2', 'xz']:
+		raise ValueError('Valid choice for compression are: "infer", None, "gzip", "bz2", or "xz"')
+	opener = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}[compression]
+	return opener(filepath, mode, **kwargs)
+
+
+class _PrefetchReader(io.RawIOBase):
+	''' Binary reader that reads (and so decompresses) fileobj in a background thread,
+		up to prefetch chunks ahead, so that inflating and parsing overlap. zlib, bz2 and
+		lzma release the GIL while decompressing. Wrap in io.BufferedReader for readline.
+		close() also closes fileobj, unless close_fileobj=False
+	'''
+	def __init__(self, fileobj, chunk_size=1048576, prefetch=4, close_fileobj=True):
+		import queue
+		import threading
+
+		self._f = fileobj
+		self._close_fileobj = close_fileobj
+		self._chunk_size = chunk_size
+		self._queue = queue.Queue(maxsize=prefetch)
+		self._stop = threading.Event()
+		self._data = b''
+		self._pos = 0
+		self._eof = False
+		self._thread = threading.Thread(target=self._prefetch)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _put(self, item):
+		import queue
+		while not self._stop.is_set():
+			try:
+				self._queue.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				continue
+
+	def _prefetch(self):
+		try:
+			while not self._stop.is_set():
+				data = self._f.read(self._chunk_size)
+				self._put(data)
+				if not data:
+					break
+		except Exception as e:
+			self._put(e)
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		if self._pos >= len(self._data):
+			if self._eof:
+				return 0
+			item = self._queue.get()
+			if isinstance(item, Exception):
+				raise item
+			if not item:
+				self._eof = True
+				return 0
+			self._data, self._pos = item, 0
+		n = min(len(b), len(self._data) - self._pos)
+		memoryview(b)[:n] = memoryview(self._data)[self._pos:self._pos + n]
+		self._pos += n
+		return n
+
+	def close(self):
+		if not self.closed:
+			self._stop.set()
+			self._thread.join()
+			if self._close_fileobj:
+				self._f.close()
+		super(_PrefetchReader, self).close()
+
+
+def filelen(filepath, n_jobs=1, bufsize=1048576, index=False):
 	''' Get the number of lines in a text file
+	* Counts b'\n' in binary mode with a reusable readinto buffer (no decoding, no 
+		per-line objects). A last line without a line end is counted too; an empty
+		file has 0 lines
+	* Line ends are '\n' and '\r\n'. Old-Mac lone '\r' line ends are not counted
+	* n_jobs > 1 splits the file in byte ranges counted by a process pool
+	* gzip / bz2 / xz files are counted on the fly, decompressed in a background 
+		thread (n_jobs and index do not apply)
 
 	--- inputs:
 	* filepath		: input file path
+	* OPT: n_jobs 	: number of worker processes (default = 1, no pool)
+	* OPT: bufsize 	: read buffer size in bytes (default = 1 MB)
+	* OPT: index 	: if True, also write the line-offset index filepath + '.idx' in 
+						the same pass (see build_lineindex(), ignores n_jobs)
 
 	--- return:
 	* number of lines
 	'''
-	f = open(str(fpath), 'r')
-	for i, l in enumerate(f):
-		pass
-	f.close()
-	return i + 1
+	compression = get_compression(filepath)
+	if compression is not None:
+		if index:
+			raise ValueError('No line-offset index for compressed files')
+		with _PrefetchReader(open_file(filepath, 'rb', compression), bufsize) as f:
+			return _count_newlines_stream(f, bufsize)
+	if index:
+		return build_lineindex(filepath, bufsize=bufsize)
+	size = os.path.getsize(filepath)
+	if size == 0:
+		return 0
+
+	if n_jobs > 1 and size > n_jobs * bufsize:
+		import concurrent.futures
+		bounds = [size * i // n_jobs for i in range(n_jobs + 1)]
+		with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as pool:
+			n_lines = sum(pool.map(_count_newlines, [filepath] * n_jobs, bounds[:-1], bounds[1:],
+									[bufsize] * n_jobs))
+	else:
+		n_lines = _count_newlines(filepath, 0, size, bufsize)
+
+	with open(filepath, 'rb') as f: 	# last line without line end
+		f.seek(-1, os.SEEK_END)
+		if f.read(1) != b'\n':
+			n_lines += 1
+	return n_lines
+
+
+def _count_newlines(filepath, start, end, bufsize=1048576):
+	''' count b'\n' in the byte range [start, end) of a file. Used by filelen() '''
+	buf = bytearray(bufsize)
+	view = memoryview(buf)
+	n_lines = 0
+	with open(filepath, 'rb', buffering=0) as f:
+		f.seek(start)
+		remaining = end - start
+		while remaining > 0:
+			n = f.readinto(view[:min(bufsize, remaining)])
+			if not n:
+				break
+			n_lines += buf.count(b'\n', 0, n)
+			remaining -= n
+	return n_lines
+
+
+def _count_newlines_stream(f, bufsize=1048576):
+	''' count the lines of a binary stream, filelen() semantics '''
+	buf = bytearray(bufsize)
+	view = memoryview(buf)
+	n_lines = 0
+	last = b'\n'
+	while True:
+		n = f.readinto(view)
+		if not n:
+			break
+		n_lines += buf.count(b'\n', 0, n)
+		last = buf[n - 1:n]
+	return n_lines + (last != b'\n')
+
+
+# ---- line-offset index (.idx sidecar) ----
+# header: magic, file size, file mtime_ns, number of lines. Then the uint64 byte offset
+# of each line start, plus the file size as end sentinel (n_lines + 1 offsets)
+_LINEIDX_MAGIC = b'LINEIDX1'
+_LINEIDX_HEADER = struct.Struct('<8sQqQ')
+
+
+def build_lineindex(filepath, idxpath='', bufsize=1048576):
+	''' Build the line-offset index of a text file and store it in a sidecar file
+		(default: filepath + '.idx'), for O(1) seek to any line with read_lines().
+		The index is 8 bytes per line and is written while scanning, never held in
+		memory. Same line semantics as filelen()
+
+	REQUIRE: numpy
+
+	--- inputs:
+	* filepath		: input file path
+	* OPT: idxpath 	: index file path (default = filepath + '.idx')
+	* OPT: bufsize 	: read buffer size in bytes (default = 1 MB)
+
+	--- return:
+	* number of lines
+	'''
+	import numpy as np
+
+	if idxpath=='':
+		idxpath = filepath + '.idx'
+	stat = os.stat(filepath)
+	buf = bytearray(bufsize)
+	view = memoryview(buf)
+	pos = 0
+	last = b'\n'
+	n_lines = 0
+	tmppath = idxpath + '.tmp'
+	with open(filepath, 'rb', buffering=0) as f, open(tmppath, 'wb') as f_idx:
+		f_idx.write(_LINEIDX_HEADER.pack(_LINEIDX_MAGIC, 0, 0, 0)) 	# placeholder
+		np.zeros(1, dtype='<u8').tofile(f_idx) 						# line 0 starts at 0
+		while True:
+			n = f.readinto(view)
+			if not n:
+				break
+			starts = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8, count=n) == 10) + (pos + 1)
+			starts.astype('<u8').tofile(f_idx)
+			n_lines += len(starts)
+			pos += n
+			last = buf[n - 1:n]
+		if last != b'\n': 	# last line without line end
+			np.array([pos], dtype='<u8').tofile(f_idx)
+			n_lines += 1
+		f_idx.seek(0)
+		f_idx.write(_LINEIDX_HEADER.pack(_LINEIDX_MAGIC, stat.st_size, stat.st_mtime_ns, n_lines))
+	os.replace(tmppath, idxpath)
+
+	return n_lines
+
+
+def load_lineindex(filepath, idxpath=''):
+	''' Load the line-offset index of a text file, see build_lineindex()
+
+	REQUIRE: numpy
+
+	--- inputs:
+	* filepath		: input file path
+	* OPT: idxpath 	: index file path (default = filepath + '.idx')
+
+	--- return:
+	* read-only numpy memmap of n_lines + 1 byte offsets (line i = bytes 
+		offsets[i]:offsets[i+1]), or None if the index does not exist or is stale
+		(file size or mtime changed since it was built)
+	'''
+	import numpy as np
+
+	if idxpath=='':
+		idxpath = filepath + '.idx'
+	if not os.path.isfile(idxpath):
+		return None
+	with open(idxpath, 'rb') as f_idx:
+		header = f_idx.read(_LINEIDX_HEADER.size)
+	if len(header) < _LINEIDX_HEADER.size:
+		return None
+	magic, size, mtime_ns, n_lines = _LINEIDX_HEADER.unpack(header)
+	stat = os.stat(filepath)
+	if magic!=_LINEIDX_MAGIC or size!=stat.st_size or mtime_ns!=stat.st_mtime_ns:
+		return None
+	return np.memmap(idxpath, dtype='<u8', mode='r', offset=_LINEIDX_HEADER.size, shape=(n_lines + 1,))
 
 
-def splitfile(filepath, maxlines=1000, outdir='', header=True):
+def read_lines(filepath, start, stop=None, idxpath='', encoding='utf-8'):
+	''' Read lines [start, stop) of a text file with one seek, using the line-offset
+		index (built first if missing or stale, see build_lineindex())
+
+	--- inputs:
+	* filepath		: input file path
+	* start 		: first line number (0-based)
+	* OPT: stop 	: line number after the last line (default = start + 1). Clipped to
+						the number of lines
+	* OPT: idxpath 	: index file path (default = filepath + '.idx')
+	* OPT: encoding : text encoding. None = return bytes
+
+	--- return:
+	* list of lines, with their line ends
+	'''
+	offsets = load_lineindex(filepath, idxpath)
+	if offsets is None:
+		build_lineindex(filepath, idxpath)
+		offsets = load_lineindex(filepath, idxpath)
+	n_lines = len(offsets) - 1
+	if stop is None:
+		stop = start + 1
+	start, stop = max(0, min(start, n_lines)), max(0, min(stop, n_lines))
+	if start >= stop:
+		return []
+
+	with open(filepath, 'rb') as f:
+		f.seek(int(offsets[start]))
+		data = f.read(int(offsets[stop]) - int(offsets[start]))
+	lines = data.splitlines(True) if b'\r' not in data else io.BytesIO(data).readlines()
+	if encoding is not None:
+		lines = [l.decode(encoding) for l in lines]
+	return lines
+
+
+def splitfile(filepath, maxlines=1000, outdir='', header=True, maxbytes=None, n_jobs=1, compress=None):
 	''' Split a text file (e.g. csv) into multiple, smaller files. The new file names are
 		enumerated from 0.
+	* Works on newline-aligned byte ranges: the range boundaries are found first (from
+		the line-offset index if there is a valid one, see build_lineindex(), else by
+		one scan, or with mmap for maxbytes), then each range is copied by the kernel
+		(os.copy_file_range / os.sendfile, plain read/write as fallback). Lines are
+		copied byte for byte, line ends included
+	* The header line is repeated at the top of every new file
+	* gzip / bz2 / xz input files (see get_compression()), or compressed new files, are 
+		split line by line in one stream instead, decompressing in a background thread
 
 	--- inputs:
 	* filepath		: input file path
-	* OPT: maxlines 	: max num of lines inthe new files (default = 1000)
+	* OPT: maxlines 	: max num of lines in the new files, header line excluded (default = 1000)
 	* OPT: outdir		: output directory, if not the current dir
 	* OPT: header 		: if True, the first line is a header line (useful for csv) 
+	* OPT: maxbytes 	: if given, split by size instead of maxlines: max num of bytes in the
+							new files, header excluded (a single longer line gets its own file)
+	* OPT: n_jobs 		: number of new files written in parallel (threads, default = 1)
+	* OPT: compress 	: compress the new files: 'gzip', 'bz2', or 'xz' (default = None)
 
 	--- return:
-	* list of (output file, number of lines in the file) tuples
+	* list of (output file, number of lines in the file, header excluded) tuples
 	'''
-	list_fnew = []
-	list_lenfnew = []
+	import concurrent.futures
+
 	basefn = os.path.basename(filepath)
+	if os.path.splitext(basefn)[1].lower() in _COMPRESSION_EXT:
+		basefn = os.path.splitext(basefn)[0]
 	ext = os.path.splitext(basefn)[1]
-	if not oudtir=='':
+	if not outdir=='':
 		basefn = os.path.join( outdir, os.path.splitext(basefn)[0])
 	else:
 		basefn = os.path.splitext(basefn)[0]
 
-	fnum = 0
-	newfn = basefn + '_' + str(fnum) + ext
-	f_old = open(str(filepath), 'r')
-	f_new = open(str(filepath), 'w')
-	list_fnew.append(os.path.abspath(newfn))
-	for i, l in enumerate(f_old):
-		f_new.write(l.strip() + '\n')
-		if i==0:
-			if header:
-				header = l.strip() + '\n'
-			else:
-				header = ''
-		if ( (i+1)%maxlines )==0: 	# open new file
-			list_lenfnew.append(maxlines)
-			f_new.close()
-			fnum += 1
-			newfn = basefn + '_' + str(fnum) + ext
-			f_new = open(str(newfn), 'w')
-			list_fnew.append(os.path.abspath(newfn))
-			f_new.write(header)
-	list_lenfnew.append((i+1)%maxlines)
-	f_old.close()
+	compression = get_compression(filepath)
+	if compression is not None or compress is not None:
+		if compress is not None:
+			ext += {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}[compress]
+		return _splitfile_stream(filepath, compression, basefn, ext, maxlines, header, maxbytes, compress)
+
+	# --- header & byte ranges of the new files ---
+	size = os.path.getsize(filepath)
+	with open(filepath, 'rb') as f:
+		header_bytes = f.readline() if header else b''
+	if maxbytes is not None:
+		bounds = _byte_boundaries(filepath, len(header_bytes), size, maxbytes)
+		list_lenfnew = None 	# counted while copying
+	else:
+		bounds, list_lenfnew = _line_boundaries(filepath, len(header_bytes), size, maxlines, header)
+
+	list_fnew = [os.path.abspath(basefn + '_' + str(fnum) + ext) for fnum in range(len(bounds) - 1)]
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, n_jobs)) as pool:
+		counts = list(pool.map(_copy_range, [filepath] * len(list_fnew), bounds[:-1], bounds[1:],
+								list_fnew, [header_bytes] * len(list_fnew),
+								[list_lenfnew is None] * len(list_fnew)))
+	if list_lenfnew is None:
+		list_lenfnew = counts
+
+	return list(zip(list_fnew, list_lenfnew))
+
+
+def _splitfile_stream(filepath, compression, basefn, ext, maxlines, header, maxbytes, compress):
+	''' splitfile() line by line, for compressed input or output files '''
+	list_fnew = []
+	list_lenfnew = []
+	f_new = None
+	with io.BufferedReader(_PrefetchReader(open_file(filepath, 'rb', compression)), 1048576) as f_old:
+		header_bytes = f_old.readline() if header else b''
+		for l in f_old:
+			if f_new is None or (n_lines >= maxlines if maxbytes is None else 
+									n_bytes > 0 and n_bytes + len(l) > maxbytes): 	# open new file
+				if f_new is not None:
+					f_new.close()
+					list_lenfnew.append(n_lines)
+				list_fnew.append(os.path.abspath(basefn + '_' + str(len(list_fnew)) + ext))
+				f_new = open_file(list_fnew[-1], 'wb', compress)
+				f_new.write(header_bytes)
+				n_lines, n_bytes = 0, 0
+			f_new.write(l)
+			n_lines += 1
+			n_bytes += len(l)
+	if f_new is None: 	# no data lines
+		list_fnew.append(os.path.abspath(basefn + '_0' + ext))
+		f_new = open_file(list_fnew[-1], 'wb', compress)
+		f_new.write(header_bytes)
+		n_lines = 0
 	f_new.close()
+	list_lenfnew.append(n_lines)
 
-	return zip(list_fnew, list_lenfnew)
+	return list(zip(list_fnew, list_lenfnew))
+
+
+def partitionfile(filepath, keycols, nparts, outdir='', header=True, sep=',', maxbuffer=67108864,
+					encoding='utf-8'):
+	''' Split a csv file into nparts files by hashing the key column(s), in one pass, so
+		that all the rows with the same key end up in the same file (e.g. for parallel
+		joins / groupbys). The new file names are enumerated from 0, as splitfile().
+	* The hash (crc32 of the key fields) is stable between runs and machines
+	* Rows are buffered per partition and all buffers are written out when their total
+		size reaches maxbuffer
+	* The header line is repeated at the top of every new file
+	* gzip / bz2 / xz input files are decompressed on the fly (new files are plain)
+	* One row per line: quoted fields may contain sep, but not line ends
+
+	--- inputs:
+	* filepath		: input file path
+	* keycols 		: key column name (requires header) or 0-based column number, or a 
+						list of them
+	* nparts 		: number of new files
+	* OPT: outdir		: output directory, if not the current dir
+	* OPT: header 		: if True, the first line is a header line 
+	* OPT: sep 			: field separator (default = ',')
+	* OPT: maxbuffer 	: max total bytes buffered before writing (default = 64 MB)
+	* OPT: encoding 	: text encoding, only used to read the header and quoted rows
+
+	--- return:
+	* list of (output file, number of rows in the file, header excluded) tuples
+	'''
+	import csv
+	import zlib
+
+	keycols = keycols if isinstance(keycols, (list, tuple)) else [keycols]
+	basefn = os.path.basename(filepath)
+	if os.path.splitext(basefn)[1].lower() in _COMPRESSION_EXT:
+		basefn = os.path.splitext(basefn)[0]
+	ext = os.path.splitext(basefn)[1]
+	if not outdir=='':
+		basefn = os.path.join( outdir, os.path.splitext(basefn)[0])
+	else:
+		basefn = os.path.splitext(basefn)[0]
+	list_fnew = [os.path.abspath(basefn + '_' + str(fnum) + ext) for fnum in range(nparts)]
+	list_lenfnew = [0] * nparts
+	bsep = sep.encode(encoding)
+
+	with io.BufferedReader(_PrefetchReader(open_file(filepath, 'rb')), 1048576) as f_old:
+		header_bytes = f_old.readline() if header else b''
+		names = next(csv.reader([header_bytes.decode(encoding)], delimiter=sep)) if header else []
+		keyidx = []
+		for col in keycols:
+			if isinstance(col, int):
+				keyidx.append(col)
+			elif col in names:
+				keyidx.append(names.index(col))
+			else:
+				raise ValueError('Key column "%s" not found in the header' %col)
+
+		list_f = [open(fn, 'wb') for fn in list_fnew]
+		try:
+			for f_new in list_f:
+				f_new.write(header_bytes)
+			buffers = [[] for _ in range(nparts)]
+			n_buffered = 0
+			for line in f_old:
+				if b'"' in line:
+					fields = [x.encode(encoding) for x in
+								next(csv.reader([line.decode(encoding)], delimiter=sep))]
+				else:
+					fields = line.rstrip(b'\r\n').split(bsep)
+				key = b'\x1f'.join(fields[i] if i < len(fields) else b'' for i in keyidx)
+				part = zlib.crc32(key) % nparts
+				buffers[part].append(line if line.endswith(b'\n') else line + b'\n')
+				list_lenfnew[part] += 1
+				n_buffered += len(line)
+				if n_buffered >= maxbuffer:
+					for f_new, buf in zip(list_f, buffers):
+						f_new.write(b''.join(buf))
+						del buf[:]
+					n_buffered = 0
+			for f_new, buf in zip(list_f, buffers):
+				f_new.write(b''.join(buf))
+		finally:
+			for f_new in list_f:
+				f_new.close()
+
+	return list(zip(list_fnew, list_lenfnew))
+
+
+def _line_boundaries(filepath, data_start, size, maxlines, header):
+	''' byte offsets of the splitfile() ranges of maxlines lines starting at data_start,
+		and the number of lines in each range
+	'''
+	import numpy as np
+
+	offsets = load_lineindex(filepath)
+	if offsets is not None:
+		first = 1 if header and data_start > 0 else 0
+		n_lines = len(offsets) - 1 - first
+		bounds = [int(x) for x in offsets[first:len(offsets) - 1:maxlines]] + [size]
+		if len(bounds) == 1: 	# no data lines
+			bounds = [data_start, size]
+	else:
+		bounds = [data_start]
+		n_lines = 0
+		buf = bytearray(1048576)
+		view = memoryview(buf)
+		pos = data_start
+		last = b'\n'
+		with open(filepath, 'rb', buffering=0) as f:
+			f.seek(data_start)
+			while True:
+				n = f.readinto(view)
+				if not n:
+					break
+				ends = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8, count=n) == 10)
+				line_num = n_lines + np.arange(1, len(ends) + 1) 	# lines done after each line end
+				bounds.extend(int(x) for x in ends[line_num % maxlines == 0] + (pos + 1))
+				n_lines += len(ends)
+				pos += n
+				last = buf[n - 1:n]
+		if pos > data_start and last != b'\n':
+			n_lines += 1
+		if bounds[-1] != size or len(bounds) == 1:
+			bounds.append(size)
+
+	n_files = len(bounds) - 1
+	list_len = [maxlines] * (n_files - 1) + [n_lines - maxlines * (n_files - 1)]
+	return bounds, list_len
+
+
+def _byte_boundaries(filepath, data_start, size, maxbytes):
+	''' byte offsets of the splitfile() ranges of at most maxbytes, cut after a line end '''
+	import mmap
+
+	bounds = [data_start]
+	if size <= data_start:
+		return bounds + [size]
+	with open(filepath, 'rb') as f:
+		mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			start = data_start
+			while start < size:
+				target = start + maxbytes
+				if target >= size:
+					end = size
+				else:
+					end = mm.rfind(b'\n', start, target) + 1
+					if end == 0: 	# line longer than maxbytes
+						end = mm.find(b'\n', target) + 1 or size
+				bounds.append(end)
+				start = end
+		finally:
+			mm.close()
+	return bounds
+
+
+def _copy_range(filepath, start, end, outpath, header_bytes=b'', count_lines=False):
+	''' copy bytes [start, end) of filepath to a new file outpath, after header_bytes.
+		Return the number of lines copied if count_lines, else None
+	'''
+	with open(filepath, 'rb') as f_in, open(outpath, 'wb') as f_out:
+		f_out.write(header_bytes)
+		f_out.flush()
+		_copy_fd_range(f_in.fileno(), f_out.fileno(), start, end - start)
+	if count_lines:
+		n_lines = _count_newlines(filepath, start, end)
+		if end > start:
+			with open(filepath, 'rb') as f:
+				f.seek(end - 1)
+				n_lines += f.read(1) != b'\n'
+		return n_lines
+
+
+def _copy_fd_range(fd_in, fd_out, offset, count):
+	''' copy count bytes from offset of fd_in to the current position of fd_out, in the
+		kernel if possible: os.copy_file_range (Linux, py3.8+), os.sendfile (Linux),
+		else read / write
+	'''
+	if count <= 0:
+		return
+	pos_out = os.lseek(fd_out, 0, os.SEEK_CUR)
+	done = 0
+	for fast_copy in ['copy_file_range', 'sendfile']:
+		if not hasattr(os, fast_copy):
+			continue
+		try:
+			while done < count:
+				if fast_copy=='copy_file_range':
+					n = os.copy_file_range(fd_in, fd_out, count - done, offset + done)
+				else:
+					n = os.sendfile(fd_out, fd_in, offset + done, count - done)
+				if n == 0:
+					break
+				done += n
+			if done == count:
+				return
+		except OSError: 	# e.g. not supported for this file system / OS, try the next one
+			pass
+		os.lseek(fd_out, pos_out + done, os.SEEK_SET)
+
+	os.lseek(fd_in, offset + done, os.SEEK_SET)
+	while done < count:
+		data = os.read(fd_in, min(1048576, count - done))
+		if not data:
+			break
+		os.write(fd_out, data)
+		done += len(data)
 
 
 # =============================================================================
@@ -389,27 +1546,334 @@ def list_diff(a, b):
 	return list( set(a) - set(b) )
 
 
-def source_sh(bash_filepath, sh_cmd='bash', timeout_sec=15):
+def source_sh(bash_filepath, sh_cmd='bash', timeout_sec=15, cache=True, cachedir=''):
 	'''
 	mimic sourcing a bash file and get the environment variables. the env variables
 	are only available for this python session only
-
-	REQUIRE: bash or csh
+	* The environment after sourcing is read with NUL-delimited "env -0", so multi-line
+		values are kept
+	* The effect of the script (the change of environment) is cached per script path, 
+		content hash and sh_cmd, together with the input environment it was captured 
+		from. A later call replays it without starting a shell if the environment is 
+		the same apart from the variables the script sets, and those still have their
+		value from before or after sourcing. So sourcing again an already sourced 
+		script is a no-op, e.g. "export PATH=/opt/x/bin:$PATH" prefixes PATH only once. 
+		The script itself is assumed deterministic (e.g. not reading other files that
+		change)
+
+	REQUIRE: bash or csh, env with -0 (GNU coreutils, BSD)
 
 	--- inputs:
 	* bash_filepath 	: path to a bash (.sh) file
 	* OPT: sh_cmd 		: the command to run the shell (bash or csh, default = "bash")
-	* OPT: timeout_sec 	: timeout in second (default = 15)
+	* OPT: timeout_sec 	: timeout in second (default = 15), subprocess.TimeoutExpired
+	* OPT: cache 		: if False, do not use the in-memory cache
+	* OPT: cachedir 	: if given, also keep the cache on disk in this directory (one
+							json file per script), shared between processes
 
 	--- return:
-	* none
+	* dict of the changed environment variables: {name: new value, or None if unset}
+	* subprocess.CalledProcessError if sourcing fails or the script exits the shell
+		(e.g. "exit 0"), nothing is applied or cached then
 	'''
-	command = ['bash', '-c', 'source %s && env' %bash_filepath]
-	proc = subprocess.Popen(command, stdout = subprocess.PIPE)
+	entries = None
+	if cache or cachedir!='':
+		key = _source_sh_key(bash_filepath, sh_cmd)
+		entries = _SOURCE_SH_CACHE.get(key) if cache else None
+		if entries is None and cachedir!='':
+			cachepath = os.path.join(cachedir, key + '.json')
+			entries = _load_source_sh_cache(cachepath)
+		entries = entries or []
+		diff = _match_source_sh_cache(entries, os.environ)
+	else:
+		diff = None
+
+	if diff is None:
+		# the marker tells an env capture from a script that exited the shell (exit 0)
+		cmd = 'source %s >/dev/null && printf "%s" && env -0' %(shlex.quote(bash_filepath), _ENV_MARKER_SH)
+		if os.path.basename(sh_cmd).endswith('csh'):
+			cmd = 'source %s >& /dev/null && printf "%s" && env -0' %(shlex.quote(bash_filepath), _ENV_MARKER_SH)
+		proc = subprocess.run([sh_cmd, '-c', cmd], stdout=subprocess.PIPE, timeout=timeout_sec, check=True)
+		if not proc.stdout.startswith(_ENV_MARKER):
+			raise subprocess.CalledProcessError(proc.returncode, [sh_cmd, '-c', cmd], proc.stdout)
+		diff = _env_diff(os.environ, _parse_env0(proc.stdout[len(_ENV_MARKER):]))
+		if entries is not None:
+			entries.insert(0, [_env_hash(os.environ, diff), diff, {k : os.environ.get(k) for k in diff}])
+			del entries[_SOURCE_SH_ENTRIES:]
+			if cachedir!='':
+				_save_source_sh_cache(cachepath, entries)
+	if cache:
+		_lru_put(_SOURCE_SH_CACHE, key, entries, _SOURCE_SH_SIZE)
+
+	for name, value in diff.items():
+		if value is None:
+			os.environ.pop(name, None)
+		else:
+			os.environ[name] = value
+	return dict(diff)
+
+
+# ---- source_sh cache ----
+# script key: [[hash of the input env without the variables set, diff, their values before]]
+_SOURCE_SH_CACHE = collections.OrderedDict() 	# least recently used first
+_SOURCE_SH_HASH = collections.OrderedDict() 	# abs path: (size, mtime_ns, content hash)
+_SOURCE_SH_SIZE = 256 			# scripts kept in each cache
+_SOURCE_SH_ENTRIES = 8 			# input environments kept per script
+_ENV_IGNORE = set(['_', 'SHLVL', 'PWD', 'OLDPWD']) 	# set by the shell itself
+_ENV_MARKER = b'\x03env\0' 		# printed before the env -0 output
+_ENV_MARKER_SH = '\\003env\\000' 	# the same, for printf
+
+
+def _lru_put(lru, key, value, maxsize):
+	''' put key in an OrderedDict used as LRU cache, drop the oldest beyond maxsize '''
+	lru[key] = value
+	lru.move_to_end(key)
+	while len(lru) > maxsize:
+		lru.popitem(last=False)
+
+
+def _source_sh_key(bash_filepath, sh_cmd):
+	''' source_sh(): cache key, hex digest of (script, content, sh_cmd). The content hash
+		is reused while the script size and mtime do not change '''
+	import hashlib
+
+	abspath = os.path.abspath(bash_filepath)
+	stat = os.stat(abspath)
+	cached = _SOURCE_SH_HASH.get(abspath)
+	if cached is not None and cached[:2]==(stat.st_size, stat.st_mtime_ns):
+		content = cached[2]
+	else:
+		with open(abspath, 'rb') as f:
+			content = hashlib.blake2b(f.read()).hexdigest()
+	_lru_put(_SOURCE_SH_HASH, abspath, (stat.st_size, stat.st_mtime_ns, content), _SOURCE_SH_SIZE)
+
+	key = '%s\0%s\0%s' %(abspath, content, sh_cmd)
+	return hashlib.blake2b(key.encode('utf-8', 'surrogateescape')).hexdigest()
 
-	for line in proc.stdout:
-		(key, _, value) = line.partition("=")
-		os.environ[key] = value.rstrip('\n') 	# remove trailing EOL
+
+def _env_hash(env, exclude=()):
+	''' hex digest of an environment, without the variables in exclude '''
+	import hashlib
+
+	h = hashlib.blake2b()
+	for name, value in sorted(env.items()):
+		if not name in _ENV_IGNORE and not name in exclude:
+			h.update(('%s=%s\0' %(name, value)).encode('utf-8', 'surrogateescape'))
+	return h.hexdigest()
+
+
+def _match_source_sh_cache(entries, env):
+	''' source_sh(): the cached diff that applies to env, None if none '''
+	for entry in entries:
+		env_hash, diff, before = entry
+		if all(env.get(k) in (v, before.get(k)) for k, v in diff.items()) and \
+				_env_hash(env, diff)==env_hash:
+			return diff
+	return None
+
+
+def _load_source_sh_cache(cachepath):
+	''' source_sh(): entries of a disk cache file, None if none or unreadable '''
+	try:
+		with open(cachepath) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+
+def _save_source_sh_cache(cachepath, entries):
+	''' source_sh(): write a disk cache file atomically '''
+	chk_mkdir(os.path.dirname(os.path.abspath(cachepath)))
+	tmppath = cachepath + '.%d.tmp' %os.getpid()
+	with open(tmppath, 'w') as f:
+		json.dump(entries, f)
+	os.replace(tmppath, cachepath)
+
+
+def _parse_env0(data):
+	''' {name: value} from the output of "env -0" (bytes) '''
+	env = {}
+	for item in data.decode('utf-8', 'surrogateescape').split('\0'):
+		name, sep, value = item.partition('=')
+		if sep:
+			env[name] = value
+	return env
+
+
+def _env_diff(before, after):
+	''' {name: new value, or None if unset} from environment before to after '''
+	diff = {k : v for k, v in after.items() if before.get(k)!=v and not k in _ENV_IGNORE}
+	diff.update((k, None) for k in before if not k in after and not k in _ENV_IGNORE)
+	return diff
+
+
+class ShellWorker(object):
+	''' Long-lived bash coprocess that sources scripts on request and returns the change 
+		of environment, to amortize the shell startup (and profile loading) over many 
+		scripts, e.g. hundreds of tool setup scripts in one session.
+	* Each script is sourced in a subshell (fork, no new bash), so the requests do not 
+		see each other's changes. The change is relative to the environment of the 
+		worker, i.e. os.environ when it was started (restart() to take a new one)
+	* Requests are sent over a pipe and can be pipelined (source_many())
+	* A request over its timeout kills the worker (subprocess.TimeoutExpired); a worker
+		that died is restarted on the next request
+	* The environment is not applied to os.environ, see source_sh() for that
+
+	REQUIRE: bash, env with -0
+
+	--- inputs:
+	* OPT: sh_cmd 	: bash executable (default = "bash")
+	* OPT: login 	: if True, start a login shell (loads the profile once)
+
+	EXAMPLE:
+		* with ShellWorker() as sw:
+		* 	diff = sw.source('/opt/tool/setup.sh')
+		* 	diffs = sw.source_many(list_of_setup_scripts)
+	'''
+	def __init__(self, sh_cmd='bash', login=False):
+		self.sh_cmd = sh_cmd
+		self.login = login
+		self._proc = None
+		self._buf = b''
+		self.restart()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def restart(self):
+		''' (re)start the shell and capture its base environment '''
+		self.close()
+		cmd = [self.sh_cmd] + (['-l'] if self.login else []) + ['-s']
+		self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+			stderr=subprocess.DEVNULL, start_new_session=True) 	# own process group
+		self._buf = b''
+		token = self._send('env -0')
+		self._base = _parse_env0(self._receive(token, 15)[1])
+
+	def close(self, timeout_sec=5):
+		''' stop the shell '''
+		if self._proc is None:
+			return
+		try:
+			self._proc.stdin.write(b'exit\n')
+			self._proc.stdin.close()
+			self._proc.wait(timeout_sec)
+		except (OSError, subprocess.TimeoutExpired): 	# also kill what the script started
+			import signal
+			try:
+				os.killpg(self._proc.pid, signal.SIGKILL)
+			except OSError:
+				self._proc.kill()
+			self._proc.wait()
+		self._proc.stdout.close()
+		self._proc = None
+
+	def source(self, bash_filepath, timeout_sec=15):
+		''' source one script, return {name: new value, or None if unset}. Raise 
+			subprocess.CalledProcessError if sourcing fails or the script exits (e.g.
+			"exit 0") '''
+		return self.source_many([bash_filepath], timeout_sec)[0]
+
+	def source_many(self, bash_filepaths, timeout_sec=15, pipeline=16, return_exceptions=False):
+		''' source several scripts, with up to pipeline requests in the pipe at a time
+
+		--- inputs:
+		* bash_filepaths 	: list of script paths
+		* OPT: timeout_sec 	: timeout of each request, in second
+		* OPT: pipeline 	: max number of requests sent ahead of the answers
+		* OPT: return_exceptions : if True, a failed script gives its CalledProcessError
+								in the output list, else the first one is raised once 
+								all are done
+
+		--- return:
+		* list of {name: new value, or None if unset}, in the order of bash_filepaths
+		'''
+		if self._proc is None or self._proc.poll() is not None:
+			logger.warning('ShellWorker: shell is not running, restarting')
+			self.restart()
+		out = []
+		sent = collections.deque()
+		paths = list(bash_filepaths)
+		i = 0
+		while i < len(paths) or sent:
+			while i < len(paths) and len(sent) < pipeline:
+				sent.append((paths[i], self._send('source %s >/dev/null 2>&1 </dev/null && printf "%s" && env -0'
+					%(shlex.quote(paths[i]), _ENV_MARKER_SH))))
+				i += 1
+			path, token = sent.popleft()
+			rc, data = self._receive(token, timeout_sec)
+			if rc!=0 or not data.startswith(_ENV_MARKER): 	# failed, or exited the subshell
+				out.append(subprocess.CalledProcessError(rc, ['source', path]))
+			else:
+				out.append(_env_diff(self._base, _parse_env0(data[len(_ENV_MARKER):])))
+
+		errors = [e for e in out if isinstance(e, Exception)]
+		if errors and not return_exceptions:
+			raise errors[0]
+		return out
+
+	def _send(self, cmd):
+		''' write one request, return its token '''
+		import uuid
+
+		token = uuid.uuid4().hex 	# answer = \002 token \0 output \001 token rc \0
+		line = 'printf "\\002%s\\000"; ( %s ); printf "\\001%s %%d\\000" $?\n' %(token, cmd, token)
+		try:
+			self._proc.stdin.write(line.encode('utf-8', 'surrogateescape'))
+			self._proc.stdin.flush()
+		except OSError: 	# broken pipe: the shell died
+			self._died()
+		return token
+
+	def _receive(self, token, timeout_sec):
+		''' read the answer of one request: (return code, env -0 output). Output before 
+			its start marker (e.g. printed by the profile at startup) is dropped '''
+		import time
+		import select
+
+		start = b'\x02' + token.encode('ascii') + b'\0'
+		marker = b'\x01' + token.encode('ascii') + b' '
+		deadline = time.time() + timeout_sec
+		fd = self._proc.stdout.fileno()
+		while True:
+			pos = self._buf.find(marker)
+			if pos >= 0:
+				end = self._buf.find(b'\0', pos)
+				if end >= 0:
+					begin = self._buf.rfind(start, 0, pos)
+					data = self._buf[begin + len(start):pos] if begin >= 0 else b''
+					rc = int(self._buf[pos + len(marker):end])
+					self._buf = self._buf[end + 1:]
+					return rc, data
+			remaining = deadline - time.time()
+			if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+				self.close(timeout_sec=0)
+				raise subprocess.TimeoutExpired([self.sh_cmd], timeout_sec)
+			chunk = os.read(fd, 1048576)
+			if not chunk:
+				self._died()
+			self._buf += chunk
+
+	def _died(self):
+		self.close(timeout_sec=0)
+		raise ChildProcessError('ShellWorker: shell died, it is restarted on the next request')
+
+
+_SHELL_WORKER = None
+
+
+def shell_worker():
+	''' the ShellWorker shared by this python session, started on first use and stopped at
+		exit '''
+	global _SHELL_WORKER
+	if _SHELL_WORKER is None:
+		import atexit
+		_SHELL_WORKER = ShellWorker()
+		atexit.register(_SHELL_WORKER.close)
+	return _SHELL_WORKER
 
 
 def img_pixels(x_aspect, y_aspect, max_px=100):
@@ -474,24 +1938,312 @@ def tcllist(raw_tcl_list):
 		return out
 
 
-def read_in_chunks(file_object, chunk_size=1024):
+def read_in_chunks(file_object, chunk_size=1024, background=False):
 	'''
 	Lazy function (generator) to read a file chunk by chunk. Default chunk size is 1k.
 	Use for streaming very large file without line end. If have line end, just open and
 	read line by line.
 
 	--- inputs:
-	* file_object 		: file object, e.g. output of open()
+	* file_object 		: file object, e.g. output of open(), or file path. A file path 
+							is opened in binary mode and gzip / bz2 / xz files are 
+							decompressed on the fly (see open_file())
 	* OPT: chunk_size 	: chunk size in byte
+	* OPT: background 	: if True, read (and decompress) ahead in a background thread.
+							Binary data only
 
 	--- return:
 	* yield the data chunk by chunk
+
+	For large binary files, readinto_chunks() is faster: one reused buffer, no new object
+	per chunk.
 	'''
-	while True:
-		data = file_object.read(chunk_size)
-		if not data:
-			break
-		yield data
+	close = isinstance(file_object, str)
+	if close:
+		file_object = open_file(file_object, 'rb')
+	if background: 	# closing it stops the background thread
+		file_object = _PrefetchReader(file_object, chunk_size, close_fileobj=close)
+		close = True
+	try:
+		while True:
+			data = file_object.read(chunk_size)
+			if not data:
+				break
+			yield data
+	finally:
+		if close:
+			file_object.close()
+
+
+async def aread_in_chunks(file_object, chunk_size=1024, prefetch=4, executor=None):
+	'''
+	Asyncio counterpart of read_in_chunks(): async generator, the blocking reads run in a
+	thread pool so the event loop is not blocked, up to prefetch chunks ahead, so that 
+	disk reads (and decompression) overlap with the processing of the current chunk.
+
+	e.g. 	async for chunk in aread_in_chunks(fpath, 1048576):
+				await process(chunk)
+
+	* Backpressure: reading pauses when prefetch chunks are waiting for the consumer
+	* Cancellation: cancelling the consuming task, break out of the loop or aclose()
+		stops the read-ahead (the read in flight, if any, is waited for) and closes the
+		file if it was opened here. Wrap in contextlib.aclosing() to do it right away 
+		instead of when the generator is garbage collected
+
+	--- inputs:
+	* file_object 		: file object, e.g. output of open(), or file path. A file path 
+							is opened in binary mode, gzip / bz2 / xz are decompressed 
+							on the fly (see open_file())
+	* OPT: chunk_size 	: chunk size in byte, as read_in_chunks()
+	* OPT: prefetch 	: max number of chunks read ahead (>= 1)
+	* OPT: executor 	: concurrent.futures executor for the reads (default = the 
+							loop's default thread pool)
+
+	--- return:
+	* async yield the data chunk by chunk
+	'''
+	import asyncio
+
+	if prefetch < 1:
+		raise ValueError('prefetch must be >= 1, got %s' %prefetch)
+
+	loop = asyncio.get_running_loop()
+	close = isinstance(file_object, str)
+	if close:
+		file_object = await loop.run_in_executor(executor, open_file, file_object, 'rb')
+	queue = asyncio.Queue(maxsize=prefetch)
+	reading = None 		# the read in flight: a thread can't be cancelled, it is waited for
+
+	async def producer():
+		nonlocal reading
+		try:
+			while True:
+				reading = loop.run_in_executor(executor, file_object.read, chunk_size)
+				data = await asyncio.shield(reading)
+				await queue.put(data) 		# waits while the queue is full
+				if not data:
+					break
+		except asyncio.CancelledError:
+			raise
+		except Exception as e:
+			await queue.put(e)
+
+	task = loop.create_task(producer())
+	try:
+		while True:
+			item = await queue.get()
+			if isinstance(item, Exception):
+				raise item
+			if not item:
+				break
+			yield item
+	finally:
+		task.cancel()
+		try:
+			await task
+		except asyncio.CancelledError:
+			pass
+		if reading is not None: 	# not closed under a worker thread still reading it
+			await asyncio.wait([reading])
+			if not reading.cancelled():
+				reading.exception() 	# retrieved, not logged as "never retrieved"
+		if close:
+			file_object.close()
+
+
+def readinto_chunks(file_object, chunk_size=1048576, lines=False, use_mmap=False):
+	'''
+	Zero-copy counterpart of read_in_chunks(): fill one reusable bytearray with readinto()
+	and yield memoryview slices of it, i.e. no new bytes object per chunk.
+
+	IMPORTANT: a yielded memoryview is only valid until the next chunk is read, as the
+	buffer is reused. Use / parse it right away, or copy it with bytes(chunk).
+
+	--- inputs:
+	* file_object 		: binary file object (e.g. open(fpath, 'rb')), or file path
+	* OPT: chunk_size 	: buffer size in byte (default = 1 MB)
+	* OPT: lines 		: if True, every chunk ends at a line end: the partial last line 
+							is carried over to the next chunk (the buffer grows if a 
+							single line is longer than chunk_size). The last chunk may
+							end without line end if the file does
+	* OPT: use_mmap 	: if True, memory-map the file and yield slices of the map itself
+							(plain files only, no read at all)
+
+	--- return:
+	* yield memoryview of the data chunk by chunk
+	'''
+	close = isinstance(file_object, str)
+	if close:
+		file_object = open(file_object, 'rb', buffering=0) if use_mmap else open_file(file_object, 'rb')
+	try:
+		if use_mmap:
+			for chunk in _mmap_chunks(file_object, chunk_size, lines):
+				yield chunk
+			return
+
+		buf = bytearray(chunk_size)
+		view = memoryview(buf)
+		tail = 0 		# bytes carried over from the previous chunk
+		while True:
+			n = file_object.readinto(view[tail:])
+			if not n:
+				if tail:
+					yield view[:tail]
+				break
+			end = tail + n
+			if not lines:
+				yield view[:end]
+				continue
+			cut = buf.rfind(b'\n', 0, end) + 1
+			if cut == 0: 		# no line end yet: grow the buffer, keep reading
+				if end == len(buf): 	# new buffer: the old one may still be viewed
+					grown = bytearray(2 * len(buf))
+					grown[:end] = view[:end]
+					buf, view = grown, memoryview(grown)
+				tail = end
+				continue
+			yield view[:cut]
+			buf[:end - cut] = view[cut:end] 	# carry the partial line over
+			tail = end - cut
+	finally:
+		if close:
+			file_object.close()
+
+
+def _mmap_chunks(file_object, chunk_size, lines):
+	''' readinto_chunks(use_mmap=True) '''
+	import mmap
+
+	if os.fstat(file_object.fileno()).st_size == 0:
+		return
+	mm = mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ)
+	view = memoryview(mm)
+	try:
+		start = 0
+		while start < len(mm):
+			end = min(start + chunk_size, len(mm))
+			if lines and end < len(mm):
+				cut = mm.rfind(b'\n', start, end) + 1 or mm.find(b'\n', end) + 1 or len(mm)
+				end = cut
+			yield view[start:end]
+			start = end
+	finally:
+		try:
+			view.release()
+			mm.close()
+		except BufferError: 	# caller still holds chunks: unmapped once they are gone
+			pass
+
+
+# ---- tail checkpoint (.ckpt sidecar) ----
+# magic, st_dev, st_ino, processed byte offset, file size seen, crc32 of the first bytes
+_TAILCKP_MAGIC = b'TAILCKP1'
+_TAILCKP_HEADER = struct.Struct('<8sQQQQI')
+_TAILCKP_HEADLEN = 1024
+
+
+def tail_lines(filepath, ckptpath='', rotated='', chunk_size=1048576, encoding=None):
+	'''
+	Incremental reader of a growing file (e.g. a log): yield only the complete lines 
+	appended since the last run. The processed byte offset and the file identity are 
+	kept in a small checkpoint file, so each run reads the new data only.
+
+	* A line counts as processed once the next one is asked for (or the generator is 
+		exhausted): stopping the loop early, or an exception while handling a line, 
+		gives that line again next run (at-least-once)
+	* A last line without line end (still being written) is left for the next run
+	* Truncation (file smaller than the offset, or its first bytes changed, e.g. 
+		copytruncate) restarts at 0
+	* Rotation (other inode): the new file is read from 0. If rotated is given and is 
+		the checkpointed file (e.g. filepath + '.1'), its rest is read first
+
+	--- inputs:
+	* filepath		: input file path (plain file, not compressed)
+	* OPT: ckptpath : checkpoint file path (default = filepath + '.ckpt')
+	* OPT: rotated 	: path the file is rotated to, to finish it after a rotation
+	* OPT: chunk_size : read buffer size in byte (default = 1 MB)
+	* OPT: encoding : text encoding. None = yield bytes
+
+	--- return:
+	* yield the new lines, with their line ends
+	'''
+	if ckptpath=='':
+		ckptpath = filepath + '.ckpt'
+	ckpt = _load_tailckpt(ckptpath)
+
+	if ckpt is not None and rotated!='' and os.path.isfile(rotated):
+		stat = os.stat(filepath)
+		dev, ino = ckpt[:2]
+		if (stat.st_dev, stat.st_ino)!=(dev, ino):
+			rot_stat = os.stat(rotated)
+			if (rot_stat.st_dev, rot_stat.st_ino)==(dev, ino):
+				for line in _tail_from(rotated, ckptpath, ckpt, chunk_size, encoding):
+					yield line
+			ckpt = None
+	for line in _tail_from(filepath, ckptpath, ckpt, chunk_size, encoding):
+		yield line
+
+
+def _tail_from(filepath, ckptpath, ckpt, chunk_size, encoding):
+	''' tail_lines() of one file, from the checkpoint if it is the same file '''
+	import zlib
+
+	with open(filepath, 'rb', buffering=0) as f:
+		stat = os.fstat(f.fileno())
+		head = f.read(_TAILCKP_HEADLEN)
+		offset = 0
+		if ckpt is not None:
+			dev, ino, ck_offset, ck_size, ck_crc = ckpt
+			n_head = min(ck_offset, _TAILCKP_HEADLEN)
+			if ((stat.st_dev, stat.st_ino)==(dev, ino) and ck_offset <= stat.st_size
+					and zlib.crc32(head[:n_head])==ck_crc):
+				offset = ck_offset
+			else:
+				logger.info('%s: rotated or truncated, reading from start' %filepath)
+
+		def save():
+			nonlocal head
+			n_head = min(offset, _TAILCKP_HEADLEN)
+			if len(head) < n_head: 		# the file has grown since it was opened
+				head = os.pread(f.fileno(), _TAILCKP_HEADLEN, 0)
+			crc = zlib.crc32(head[:n_head])
+			_save_tailckpt(ckptpath, stat.st_dev, stat.st_ino, offset, max(offset, stat.st_size), crc)
+
+		f.seek(offset)
+		try:
+			for chunk in readinto_chunks(f, chunk_size, lines=True):
+				data = bytes(chunk)
+				if data[-1:]!=b'\n': 	# incomplete last line
+					break
+				lines = data.splitlines(True) if b'\r' not in data else io.BytesIO(data).readlines()
+				for line in lines:
+					yield line.decode(encoding) if encoding is not None else line
+					offset += len(line)
+				save()
+		finally:
+			save()
+
+
+def _load_tailckpt(ckptpath):
+	''' (st_dev, st_ino, offset, size, crc) from a tail_lines() checkpoint, None if none '''
+	if not os.path.isfile(ckptpath):
+		return None
+	with open(ckptpath, 'rb') as f:
+		data = f.read(_TAILCKP_HEADER.size)
+	if len(data) < _TAILCKP_HEADER.size:
+		return None
+	magic, dev, ino, offset, size, crc = _TAILCKP_HEADER.unpack(data)
+	if magic!=_TAILCKP_MAGIC:
+		return None
+	return dev, ino, offset, size, crc
+
+
+def _save_tailckpt(ckptpath, dev, ino, offset, size, crc):
+	''' write a tail_lines() checkpoint atomically '''
+	tmppath = ckptpath + '.tmp'
+	with open(tmppath, 'wb') as f:
+		f.write(_TAILCKP_HEADER.pack(_TAILCKP_MAGIC, dev, ino, offset, size, crc))
+	os.replace(tmppath, ckptpath)
 
 
 def list_variables(level='local',types=[]):
@@ -590,4 +2342,34 @@ def setup_logging(	default_path='log_config.yaml',
 # 									VERSION CHANGE
 #=========================================================================================
 # 06 Jun 2015	| V 1.0.0	|	First version
+# 17 Oct 2026	| V 1.1.0	|	filelen: binary readinto counting, optional process pool
+# 17 Oct 2026	| V 1.2.0	|	Add line-offset index: build_lineindex, load_lineindex, read_lines
+# 17 Oct 2026	| V 1.3.0	|	splitfile: fix, newline-aligned byte ranges copied in parallel, maxbytes.
+#				|			|	maxlines now excludes the header line, lines are copied unstripped
+# 17 Oct 2026	| V 1.4.0	|	Add partitionfile (hash-partitioned split by key columns)
+# 17 Oct 2026	| V 1.5.0	|	gzip / bz2 / xz support: open_file, get_compression, read_in_chunks,
+#				|			|	filelen, splitfile (compress option), partitionfile
+# 17 Oct 2026	| V 1.6.0	|	Add readinto_chunks (reusable buffer, memoryview chunks, mmap, lines)
+# 17 Oct 2026	| V 1.7.0	|	Add aread_in_chunks (asyncio, read-ahead in a thread pool)
+# 17 Oct 2026	| V 1.8.0	|	Add tail_lines (incremental reader of growing files, checkpointed)
+# 17 Oct 2026	| V 1.9.0	|	Add searchpath_iter (recursive scandir, optional thread pool).
+#				|			|	searchpath: fix missing import re and return value, uses scandir
+# 17 Oct 2026	| V 1.10.0	|	Add PathIndex (SQLite snapshot of a directory tree, incremental refresh)
+# 17 Oct 2026	| V 1.11.0	|	Add grep_files (mmap regex content search, thread or process pool)
+# 17 Oct 2026	| V 1.12.0	|	copytree: fix, parallel kernel copies, error report instead of abort
+# 17 Oct 2026	| V 1.13.0	|	copytree: sync mode (manifest of copied files, delete option)
+# 17 Oct 2026	| V 1.14.0	|	enumfn: probe and scan methods. Add enumfn_reserve (O_CREAT | O_EXCL)
+# 17 Oct 2026	| V 1.15.0	|	source_sh: fix sh_cmd / timeout_sec, env -0, cached environment change
+# 17 Oct 2026	| V 1.16.0	|	Add ShellWorker (persistent bash coprocess to source many scripts)
+# 17 Oct 2026	| V 1.16.1	|	get_compression: match the full gzip / bz2 magic (text files starting with BZh)
+# 17 Oct 2026	| V 1.16.2	|	enumfn_reserve: fix lost-race retry for non-normalized paths
+# 17 Oct 2026	| V 1.16.3	|	source_sh: cache the script effect, replayed when only its own variables
+#				|			|	differ. Bounded caches
+# 17 Oct 2026	| V 1.16.4	|	ShellWorker: start marker per request, startup output is not parsed
+# 17 Oct 2026	| V 1.16.5	|	source_sh: a script that exits the shell is an error, not "all unset"
+# 17 Oct 2026	| V 1.16.6	|	ShellWorker: a script that exits the subshell is an error, not "all unset"
+# 17 Oct 2026	| V 1.16.7	|	tail_lines: checkpoint crc of a file that was short when opened
+# 17 Oct 2026	| V 1.16.8	|	copytree: special files are per-file errors (a fifo blocked the copy)
+# 17 Oct 2026	| V 1.16.9	|	PathIndex: relative subdir / path are relative to the index, not the cwd
+# 17 Oct 2026	| V 1.16.10	|	aread_in_chunks: wait for the read in flight before closing the file
 #=========================================================================================
\ No newline at end of file
@@ -0,0 +1,96 @@
+#=========================================================================================
+# lib_general_bench.py
+# V 0.2.0
+# N. Edwin Widjonarko
+#
+# Throughput of the lib_general file helpers against the plain python way.
+# Run as a script: python lib_general_bench.py [size in MB, default = 1000]
+#=========================================================================================
+
+import os, sys
+import time
+import tempfile
+import logging
+
+from lib_general import *
+
+# ---- setup logging ----
+logger = logging.getLogger(__name__)
+
+
+def timeit(func, *args, **kwargs):
+	''' run func once, return (seconds, output) '''
+	t0 = time.time()
+	out = func(*args, **kwargs)
+	return time.time() - t0, out
+
+
+def report(name, seconds, size, extra=''):
+	print('%-32s: %6.2f s, %8.1f MB/s %s' %(name, seconds, size / 1e6 / seconds, extra))
+
+
+# ---- test data ----
+size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+line = b'2018-07-31 12:00:00,sensor_0042,23.4417,OK,some free text to make a log line\n'
+block = line * (1048576 // len(line))
+fd, fpath = tempfile.mkstemp(suffix='.csv')
+with os.fdopen(fd, 'wb') as f:
+	for _ in range(size_mb):
+		f.write(block)
+size = os.path.getsize(fpath)
+print('%s: %.1f MB' %(fpath, size / 1e6))
+
+
+# --- filelen ---
+def filelen_textmode(filepath):
+	''' the original filelen: text mode, line by line '''
+	with open(filepath, 'r') as f:
+		for i, l in enumerate(f):
+			pass
+	return i + 1
+
+t, n_ref = timeit(filelen_textmode, fpath)
+report('filelen, text mode line by line', t, size, '(%d lines)' %n_ref)
+t, n = timeit(filelen, fpath)
+report('filelen', t, size, '(%d lines)' %n)
+n_jobs = os.cpu_count() or 1
+t, n = timeit(filelen, fpath, n_jobs=n_jobs)
+report('filelen, n_jobs=%d' %n_jobs, t, size, '(%d lines)' %n)
+
+
+# --- read_in_chunks vs readinto_chunks ---
+# (mmap does not read anything until the chunks are touched: the file cache decides there)
+def consume(chunks):
+	''' walk the chunks, return (n_chunks, n_buffers): a new buffer object is an allocation '''
+	n_chunks = n_buffers = 0
+	last = None
+	for chunk in chunks:
+		n_chunks += 1
+		buf = chunk.obj if isinstance(chunk, memoryview) else chunk
+		if buf is not last:
+			n_buffers += 1
+			last = buf
+	return n_chunks, n_buffers
+
+for name, func, kwargs in [
+		('read_in_chunks, 1 KB', 		read_in_chunks, 	{}),
+		('read_in_chunks, 1 MB', 		read_in_chunks, 	{'chunk_size' : 1048576}),
+		('readinto_chunks', 			readinto_chunks, 	{}),
+		('readinto_chunks, lines', 		readinto_chunks, 	{'lines' : True}),
+		('readinto_chunks, mmap', 		readinto_chunks, 	{'use_mmap' : True}),
+		('readinto_chunks, mmap lines', readinto_chunks, 	{'use_mmap' : True, 'lines' : True}) ]:
+	with open(fpath, 'rb') as f:
+		t, (n_chunks, n_buffers) = timeit(consume, func(f, **kwargs))
+	report(name, t, size, '(%d chunks, %.0f allocations / GB)' %(n_chunks, n_buffers * 1e9 / size))
+
+
+os.remove(fpath)
+
+
+
+#=========================================================================================
+# 									VERSION CHANGE
+#=========================================================================================
+# 17 Oct 2026	| V 0.1.0	|	First version, filelen
+# 17 Oct 2026	| V 0.2.0	|	Add read_in_chunks vs readinto_chunks
+#=========================================================================================
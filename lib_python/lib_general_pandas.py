@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 #=========================================================================================
 # lib_general_pandas.py
-# V.1.0.0
+# V.1.9.5
 # N. Edwin Widjonarko
 #
 # Generic functions for pandas data frame manipulations
@@ -34,6 +34,9 @@
 #=========================================================================================
 
 import os, sys
+import pickle
+import collections
+import itertools
 import pandas as pd
 import numpy as np
 import logging
@@ -66,53 +69,237 @@ def check_missingcols(df, collist):
 	return list(set(collist) - set(cols_df))
 
 
-def df_explode(df, col):
+def check_schema(filepath, required_cols=[], dtypes={}, notnull=[], nrows=100, **read_kw):
+	''' Validate a csv file against a schema by reading only its header and the first
+		nrows rows, so invalid multi-GB files are rejected without loading them.
+	* The checks run on the sample rows only, i.e. they catch systematic problems 
+		(missing / misnamed columns, wrong formats), not a bad value at row 10^7
+	* For file paths, the sample is cached by (path, size, mtime): re-validating an
+		unchanged file does not touch the disk again. Streams are never cached
+
+	--- inputs:
+	* filepath 			: csv file path, or file-like object (read from current position)
+	* OPT: required_cols: list of required column names, case sensitive. Columns in dtypes
+							and notnull are required too
+	* OPT: dtypes 		: dict of column name: expected type, one of 'int', 'float', 
+							'numeric', 'bool', 'datetime', 'str'. A column passes if all 
+							its non-null sample values can be read as that type
+	* OPT: notnull 		: list of column names that must not have null values
+	* OPT: nrows 		: number of sample rows (default = 100). 0 = header only
+	* OPT: read_kw 		: other arguments for pd.read_csv, e.g. sep='|'
+
+	--- return:
+	* list of problems found (str). Empty list = valid
+	'''
+	if isinstance(filepath, str):
+		df = _read_csv_sample(filepath, nrows, read_kw)
+	else:
+		df = pd.read_csv(filepath, nrows=nrows, **read_kw)
+
+	problems = []
+	all_cols = list(required_cols) + [c for c in dtypes if not c in required_cols] + \
+				[c for c in notnull if not c in required_cols and not c in dtypes]
+	for col in sorted(check_missingcols(df, all_cols), key=all_cols.index):
+		problems.append('missing column "%s"' %col)
+
+	for col, expected in dtypes.items():
+		if not col in df.columns:
+			continue
+		values = df[col].dropna()
+		if expected=='str':
+			ok = True
+		elif expected in ['int', 'float', 'numeric']:
+			numbers = pd.to_numeric(values, errors='coerce')
+			ok = not numbers.isnull().any()
+			if ok and expected=='int':
+				ok = bool((numbers == np.floor(numbers)).all())
+		elif expected=='bool':
+			ok = values.astype(str).str.lower().isin(['true', 'false', '1', '0', '1.0', '0.0']).all()
+		elif expected=='datetime':
+			ok = not pd.to_datetime(values, errors='coerce').isnull().any()
+		else:
+			raise ValueError('Valid choice for dtypes values are: "int", "float", "numeric", '
+								'"bool", "datetime", or "str"')
+		if not ok:
+			problems.append('column "%s" is not %s' %(col, expected))
+
+	for col in notnull:
+		if col in df.columns and df[col].isnull().any():
+			problems.append('column "%s" has null values' %col)
+
+	return problems
+
+
+_CSV_SAMPLE_CACHE = collections.OrderedDict() 	# least recently used first
+_CSV_SAMPLE_CACHE_SIZE = 128
+
+
+def _read_csv_sample(filepath, nrows, read_kw):
+	''' header + first nrows rows of a csv file, see check_schema(). Cached by (path, 
+		size, mtime_ns, nrows, pickled read_kw), so list / dict arguments (usecols, dtype,
+		na_values, ...) are fine. read_kw that cannot be pickled (e.g. a lambda in 
+		converters) are read without cache
+	'''
+	stat = os.stat(filepath)
+	try:
+		key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, nrows,
+				pickle.dumps(sorted(read_kw.items()), protocol=pickle.HIGHEST_PROTOCOL))
+	except (pickle.PicklingError, TypeError, AttributeError):
+		return pd.read_csv(filepath, nrows=nrows, **read_kw)
+
+	df = _CSV_SAMPLE_CACHE.get(key)
+	if df is None:
+		df = pd.read_csv(filepath, nrows=nrows, **read_kw)
+		_CSV_SAMPLE_CACHE[key] = df
+		if len(_CSV_SAMPLE_CACHE) > _CSV_SAMPLE_CACHE_SIZE:
+			_CSV_SAMPLE_CACHE.popitem(last=False)
+	else:
+		_CSV_SAMPLE_CACHE.move_to_end(key)
+	return df
+
+
+def df_explode(df, col, engine='auto'):
 	''' "Explode" a column whose entry is a list into multiple ROWS of the 
-		list elements (i.e. split and stacked)
+		list elements (i.e. split and stacked). Several parallel list columns 
+		(same list length on each row) can be exploded together in one pass.
+	* Rows with empty lists are dropped
+	* Vectorized: one np.repeat indexer for the other columns and one flattening 
+		of each list column, no per-element python remap
+	* Exploded columns are object dtype with the numpy engine (as DataFrame.explode),
+		or typed (e.g. int64) with the arrow engine and for lists of numpy arrays
 
 	--- inputs:
-	* df 	: data frame
-	* col 	: str of column name that is to be split and stacked
+	* df 			: data frame
+	* col 			: str of column name, or list of column names, that is to be split 
+						and stacked
+	* OPT: engine 	: 'auto' 	= 'arrow' for arrow-backed list columns (pd.ArrowDtype), 
+								  else 'numpy'
+					  'arrow' 	= pyarrow list arrays (pyarrow required). Zero-copy for
+								  arrow-backed columns, converts python lists otherwise
+					  'numpy' 	= itertools / numpy flattening
 
 	--- return:
 	* data frame
 	'''
-	# --- indexers ---
-	i = df[col].map(len)
-	j = np.repeat(np.arange(len(df)), i)  		# how much we should expand 
-												# the frame
-	k = np.concatenate(list(map(np.arange, i))) # element num
-
-	# --- expand the frame & remap ---
-	df = df.iloc[j]                             # expand
-	df[col] = list(map(lambda xs, i: xs[i], df[col], k))  # remap
+	if not engine in ['auto', 'arrow', 'numpy']:
+		raise ValueError('Valid choice for engine are: "auto", "arrow", or "numpy"')
+	cols = [col] if isinstance(col, str) else list(col)
+	df_index = df.index
+
+	# --- flatten the list columns, get the list lengths ---
+	lengths = None
+	flat = {}
+	for c in cols:
+		flat[c], length_c = _flatten_listcol(df[c], engine)
+		if lengths is None:
+			lengths = length_c
+		elif not np.array_equal(lengths, length_c):
+			raise ValueError('List lengths of column "%s" do not match column "%s"' %(c, cols[0]))
+
+	# --- expand the frame in one go, no chained assignment ---
+	j = np.repeat(np.arange(len(df)), lengths) 	# how much we should expand the frame
+	data = {}
+	for c in df.columns:
+		if c in flat:
+			data[c] = pd.Series(flat[c], dtype=flat[c].dtype, copy=False) 	# no dtype inference
+		else:
+			data[c] = pd.Series(df[c].array.take(j), copy=False) 	# keeps extension dtypes
+	df = pd.DataFrame(data, columns=df.columns, copy=False)
+	df.index = df_index.take(j)
 
 	return df
 
 
-def df_explode_col(df, col, header=[]):
+def _flatten_listcol(ds, engine='auto'):
+	''' Flatten a series of lists into (numpy array of all elements, numpy array of
+		list lengths). Used by df_explode()
+	'''
+	arrow_type = getattr(ds.dtype, 'pyarrow_dtype', None) 	# pd.ArrowDtype column
+	if engine=='arrow' or (engine=='auto' and arrow_type is not None):
+		import pyarrow as pa
+		import pyarrow.compute as pc
+		try:
+			arr = pa.array(ds, from_pandas=True) 	# zero-copy if already arrow-backed
+		except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+			raise TypeError('Column "%s" can not be converted to an arrow list array: %s' %(ds.name, e))
+		if not (pa.types.is_list(arr.type) or pa.types.is_large_list(arr.type)):
+			raise TypeError('Column "%s" is not a list column' %ds.name)
+		lengths = pc.fill_null(pc.list_value_length(arr), 0).to_numpy().astype(np.int64)
+		return pc.list_flatten(arr).to_numpy(zero_copy_only=False), lengths
+
+	values = ds.values
+	lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+	if len(values) > 0 and all(isinstance(x, np.ndarray) for x in values):
+		return np.concatenate(values), lengths
+	flat = np.fromiter(itertools.chain.from_iterable(values), dtype=object, count=lengths.sum())
+	return flat, lengths
+
+
+def df_explode_col(df, col, header=[], dtype=None, fill_value=np.nan, max_width=None, mem_budget=None):
 	''' "Explode" a column whose entry is a list into multiple COLS of the 
 		list elements (i.e. split and stacked)
+	* The new columns always keep the index of df, so the concat can't misalign
+	* If dtype is given, the new columns are filled directly into one preallocated 
+		numpy 2-D array of that dtype (no df[col].tolist() / list-of-lists copy). Short
+		lists are padded with fill_value, long lists are cut at the output width
 
 	--- inputs:
-	* df 			: data frame
-	* col 			: str of column name that is to be split and stacked
-	* OPT: header 	: list of new column names. If empty will use auto-numbering
+	* df 				: data frame
+	* col 				: str of column name that is to be split and stacked
+	* OPT: header 		: list of new column names. If empty will use auto-numbering
+	* OPT: dtype 		: numpy dtype of the new columns, e.g. float or 'int32'. 
+							None = let pandas infer from the list of lists (default)
+	* OPT: fill_value 	: padding for lists shorter than the output width (dtype mode only,
+							default = NaN, must be valid for dtype)
+	* OPT: max_width 	: max number of new columns (dtype mode only). Default = len(header),
+							or the longest list if no header
+	* OPT: mem_budget 	: max bytes of temporary buffers (dtype mode only). Rows are processed
+							in chunks to stay under it. None = all rows at once. Note that 
+							the output array itself is always n_rows x width
 
 	--- return:
 	* data frame
 	'''
-	if len(header) > 0:
-		df_exploded = pd.DataFrame( df[col].tolist(), columns=header)
+	if dtype is None:
+		if len(header) > 0:
+			df_exploded = pd.DataFrame( df[col].tolist(), columns=header, index=df.index)
+		else:
+			df_exploded = pd.DataFrame( df[col].tolist(), index=df.index)
 	else:
-		df_exploded = pd.DataFrame( df[col].tolist())
+		values = df[col].values
+		lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+		if len(header) > 0:
+			width = len(header)
+		else:
+			width = int(lengths.max()) if len(lengths) > 0 else 0
+		if max_width is not None:
+			width = min(width, int(max_width))
+		if np.dtype(dtype).kind in 'iub' and pd.isnull(fill_value):
+			raise ValueError('fill_value %r is not valid for dtype %s' %(fill_value, dtype))
+		arr = np.full((len(values), width), fill_value, dtype=dtype)
+
+		# --- fill in chunks of rows: flat values + row/col mask per chunk ---
+		cut = bool((lengths > width).any()) 		# some lists must be cut at the width
+		lengths = np.minimum(lengths, width)
+		bytes_row = max(1, width * (arr.itemsize + 1 + 8)) 	# flat value + mask + python ref
+		chunk_rows = len(values) if mem_budget is None else max(1, int(mem_budget // bytes_row))
+		for start in range(0, len(values), max(1, chunk_rows)):
+			stop = start + chunk_rows
+			lists = values[start:stop]
+			if cut:
+				lists = [itertools.islice(x, width) for x in lists]
+			flat = np.fromiter(itertools.chain.from_iterable(lists), dtype=arr.dtype,
+								count=lengths[start:stop].sum())
+			arr[start:stop][np.arange(width) < lengths[start:stop, None]] = flat
+
+		df_exploded = pd.DataFrame(arr, index=df.index, columns=list(header)[:width] or None, copy=False)
 	df = df.drop(col, axis=1)
 	df_all = pd.concat([df, df_exploded], axis=1)
 
 	return df_all
 
 
-def outlier_whisker(ds, column, n_iqr=1.5):
+def outlier_whisker(df, column, n_iqr=1.5):
 	''' Find the distribution-insensitive outlier from a data column. User
 		can define the multiplier of the inner-quartile range for outlier
 		identification threshold. n_iqr=1.5 is the standard practice.
@@ -128,15 +315,567 @@ def outlier_whisker(ds, column, n_iqr=1.5):
 	df_data = df[column]
 	q25 = df_data.quantile(0.25)
 	q75 = df_data.quantile(0.75)
+
+	return _whisker_split(df_data, q25, q75, n_iqr)
+
+
+def _whisker_split(df_data, q25, q75, n_iqr):
+	''' Split df_data into (top outliers, bottom outliers, non-outliers) given the
+		quartiles. Used by outlier_whisker() and outlier_whisker_stream()
+	'''
 	iqr = q75 - q25
-	df_topOL = df_data[ df_data > (q25 + (n_iqr * iqr)) ]
+	df_topOL = df_data[ df_data > (q75 + (n_iqr * iqr)) ]
 	df_btmOL = df_data[ df_data < (q25 - (n_iqr * iqr)) ]
 	df_noOL = df_data[ (df_data >= (q25 - (n_iqr * iqr))) &
-						df_data <= (q25 + (n_iqr * iqr)) ]
+						(df_data <= (q75 + (n_iqr * iqr))) ]
 
 	return df_topOL, df_btmOL, df_noOL
 
 
+def outlier_whisker_multi(df, columns, by=None, n_iqr=1.5, output='mask'):
+	''' outlier_whisker() for many columns, and optionally per group, in one pass: 
+		the quartiles of all columns / groups come from a single (groupby) quantile
+		call, and the outliers are flagged with masks instead of copied frames.
+
+	--- inputs:
+	* df 			: data frame
+	* columns 		: list of numeric column names for outlier identification
+	* OPT: by 		: column name or list of column names to group by. The IQR fences are
+						computed within each group. None = whole column (default)
+	* OPT: n_iqr 	: number of IQR for outlier identification threshold
+	* OPT: output 	: 'mask' 	= return boolean data frames (top outliers, bottom outliers)
+					  'label' 	= return one categorical data frame with 'top', 'bottom', 
+									or 'none' (NaN for NaN values / NaN group keys)
+
+	--- return:
+	* see output option. Same index as df, one column per input column
+	'''
+	if not output in ['mask', 'label']:
+		raise ValueError('Valid choice for output are: "mask" or "label"')
+	columns = [columns] if isinstance(columns, str) else list(columns)
+	values = df[columns].to_numpy(dtype=float)
+
+	# --- quartiles: one row per group, plus a NaN row for rows without group ---
+	if by is None:
+		q = df[columns].quantile([0.25, 0.75])
+		q25, q75 = q.values[0:1], q.values[1:2]
+		codes = np.zeros(len(df), dtype=np.int64)
+	else:
+		grouped = df.groupby(by, sort=True)
+		q = grouped[columns].quantile([0.25, 0.75])
+		q25 = q.xs(0.25, level=-1).values
+		q75 = q.xs(0.75, level=-1).values
+		codes = grouped.ngroup().fillna(-1).values.astype(np.int64) 	# sorted group order as q, -1 = NaN key
+	nan_row = np.full((1, len(columns)), np.nan)
+	iqr = q75 - q25
+	fence_lo = np.ascontiguousarray(np.vstack([q25 - (n_iqr * iqr), nan_row]).T)
+	fence_hi = np.ascontiguousarray(np.vstack([q75 + (n_iqr * iqr), nan_row]).T)
+
+	# --- compare column by column (column-major), to keep the broadcast fences at one column ---
+	values = np.asfortranarray(values)
+	mask_top = np.empty(values.shape, dtype=bool, order='F')
+	mask_btm = np.empty(values.shape, dtype=bool, order='F')
+	for i in range(len(columns)):
+		mask_top[:, i] = values[:, i] > fence_hi[i][codes]
+		mask_btm[:, i] = values[:, i] < fence_lo[i][codes]
+	if output=='mask':
+		return (pd.DataFrame(mask_top, index=df.index, columns=columns),
+				pd.DataFrame(mask_btm, index=df.index, columns=columns))
+
+	label_codes = np.where(mask_top, 2, np.where(mask_btm, 0, 1)).astype(np.int8)
+	label_codes[np.isnan(values) | (codes < 0)[:, None]] = -1
+	return pd.DataFrame(
+		{c: pd.Categorical.from_codes(label_codes[:, i], categories=['bottom', 'none', 'top'])
+			for i, c in enumerate(columns)},
+		index=df.index, columns=columns)
+
+
+class QuantileSketch(object):
+	''' Mergeable streaming quantile sketch (KLL: Karnin, Lang & Liberty 2016) for data
+		that does not fit in memory. Feed it with update() chunk by chunk, combine 
+		sketches built in parallel workers with merge(), then query quantile().
+	* Memory stays below ~3k values plus 2 per level, i.e. practically constant (about
+		500 floats for k=200, whatever the data size)
+	* Error bound: the true rank of the returned quantile is within about +/- 2.65/k 
+		of the requested one with 99% confidence (k=200: +/- 1.3%, e.g. quantile(0.25)
+		returns a value whose true rank is within 0.237 - 0.263). Typical errors are
+		~3x smaller. Halve the error by doubling k
+	* NaN values are ignored
+	* Picklable, so sketches can be returned from multiprocessing workers
+
+	--- inputs:
+	* OPT: k 	: accuracy parameter (default = 200)
+	* OPT: seed : random seed for the compaction offsets, for reproducible results
+
+	EXAMPLE: quartiles of a column over many csv files, in parallel
+		* def sketch_file(fpath):
+			  return quantile_sketch_chunks(pd.read_csv(fpath, chunksize=10**6), 'VALUE')
+		* sketches = multiprocessing.Pool().map(sketch_file, list_fpath)
+		* sketch = functools.reduce(QuantileSketch.merge, sketches)
+		* q25, q75 = sketch.quantile([0.25, 0.75])
+	'''
+	def __init__(self, k=200, seed=None):
+		self.k = int(k)
+		self.n = 0
+		self.levels = [np.empty(0)]
+		self._rng = np.random.RandomState(seed)
+
+	def _capacity(self, h):
+		return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** (len(self.levels) - 1 - h))))
+
+	def _compress(self):
+		while sum(len(level) for level in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+			h = 0 	# lowest level over its capacity
+			while len(self.levels[h]) <= self._capacity(h):
+				h += 1
+			if h + 1 == len(self.levels):
+				self.levels.append(np.empty(0))
+			level = np.sort(self.levels[h])
+			n_even = len(level) - (len(level) % 2)
+			promoted = level[self._rng.randint(2):n_even:2] 	# every other value, weight x2
+			self.levels[h] = level[n_even:]
+			self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+	def update(self, values):
+		''' Add a chunk of values (scalar, list, numpy array, or series) '''
+		values = np.asarray(values, dtype=float).ravel()
+		values = values[~np.isnan(values)]
+		self.n += len(values)
+		self.levels[0] = np.concatenate([self.levels[0], values])
+		self._compress()
+		return self
+
+	def merge(self, other):
+		''' Merge another sketch into this one (in place), return self '''
+		if not isinstance(other, QuantileSketch):
+			raise TypeError('Input other must be a QuantileSketch')
+		while len(self.levels) < len(other.levels):
+			self.levels.append(np.empty(0))
+		for h, level in enumerate(other.levels):
+			self.levels[h] = np.concatenate([self.levels[h], level])
+		self.n += other.n
+		self.k = min(self.k, other.k)
+		self._compress()
+		return self
+
+	def quantile(self, q):
+		''' Approximate quantile(s) q (float or list of float in [0, 1]). NaN if empty '''
+		values = np.concatenate(self.levels)
+		weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+		if len(values) == 0:
+			return np.nan if np.ndim(q) == 0 else np.full(len(q), np.nan)
+		order = np.argsort(values, kind='mergesort')
+		values = values[order]
+		cum_weights = np.cumsum(weights[order])
+		pos = np.searchsorted(cum_weights, np.asarray(q, dtype=float) * cum_weights[-1], side='left')
+		out = values[np.minimum(pos, len(values) - 1)]
+		return float(out) if np.ndim(q) == 0 else out
+
+
+def quantile_sketch_chunks(chunks, column, k=200):
+	''' Build a QuantileSketch of a column from an iterator of data frame chunks, e.g.
+		pd.read_csv(fpath, chunksize=...). Non-numeric values are ignored
+
+	--- inputs:
+	* chunks 		: iterable of data frames
+	* column 		: column name
+	* OPT: k 		: sketch accuracy parameter, see QuantileSketch (default = 200)
+
+	--- return:
+	* QuantileSketch
+	'''
+	sketch = QuantileSketch(k=k)
+	for df in chunks:
+		sketch.update(pd.to_numeric(df[column], errors='coerce').values)
+	return sketch
+
+
+def outlier_whisker_stream(chunks, column, n_iqr=1.5, sketch=None, k=200):
+	''' Streaming version of outlier_whisker() for data that does not fit in memory.
+		The quartiles come from a QuantileSketch (first pass over the chunks, skipped
+		if sketch is given), then each chunk is classified in a second pass.
+	* Memory is one chunk plus the sketch, whatever the data size
+	* The quartiles are approximate, see the QuantileSketch error bound
+
+	--- inputs:
+	* chunks 		: callable returning a new iterator of data frames on every call, e.g.
+						lambda: pd.read_csv(fpath, chunksize=10**6), or a list of data 
+						frames. If sketch is given, any (single-pass) iterable
+	* column 		: column name for outlier identification
+	* OPT: n_iqr 	: number of IQR for outlier identification threshold
+	* OPT: sketch 	: prebuilt QuantileSketch of the column, e.g. merged from parallel
+						workers (see QuantileSketch example)
+	* OPT: k 		: sketch accuracy parameter if sketch is not given (default = 200)
+
+	--- return:
+	* yield (top outliers, bottom outliers, non-outliers) chunk by chunk, as outlier_whisker()
+	'''
+	def new_iter():
+		it = chunks() if callable(chunks) else chunks
+		return iter(it)
+
+	if sketch is None:
+		it = new_iter()
+		if it is chunks:
+			raise TypeError('chunks is a single-pass iterator: give a callable, a list, or a sketch')
+		sketch = quantile_sketch_chunks(it, column, k=k)
+	q25, q75 = sketch.quantile([0.25, 0.75])
+
+	for df in new_iter():
+		yield _whisker_split(df[column], q25, q75, n_iqr)
+
+
+def run_csv_pipeline(filepath, steps, chunksize=100000, n_jobs=None, max_inflight=None, outpath='',
+						required_cols=[], **read_kw):
+	''' Read a large csv file chunk by chunk, apply a chain of data frame functions
+		(e.g. df_explode, lookup_valrange_vec, outlier_whisker_multi) to each chunk in 
+		a process pool, and collect or write the results in the input order.
+	* At most max_inflight chunks are read ahead / processed / waiting at any time,
+		which bounds the memory to ~max_inflight chunks (plus the collected output if
+		outpath is not given)
+	* Each chunk is processed independently: e.g. outlier quartiles are per chunk. For
+		whole-file quartiles use outlier_whisker_stream()
+	* The step functions and arguments must be picklable, i.e. module-level functions,
+		not lambdas (n_jobs=1 runs in this process and accepts anything)
+
+	--- inputs:
+	* filepath 			: csv file path or file-like object
+	* steps 			: list of steps, applied in order. Each step is either:
+							* func 					: df = func(df)
+							* (func, kwargs) 		: df = func(df, **kwargs)
+							* (func, kwargs, out) 	: df[out] = func(df, **kwargs), out = column
+														name or list of column names (for
+														functions returning a series / frame)
+	* OPT: chunksize 	: number of rows per chunk (default = 100000)
+	* OPT: n_jobs 		: number of worker processes. None = number of cpus. 1 = no pool
+	* OPT: max_inflight : max number of chunks in flight (default = 2 x n_jobs)
+	* OPT: outpath 		: if given, write the results to this csv file (appended chunk by 
+							chunk, overwritten at start) instead of returning them
+	* OPT: required_cols: list of columns every chunk must have (check_missingcols), 
+							else ValueError
+	* OPT: read_kw 		: other arguments for pd.read_csv, e.g. sep='|'
+
+	EXAMPLE:
+		* steps = [	(df_explode, {'col': 'ITEMS'}),
+					(lookup_valrange_vec, {'col_value': 'INCOME', 'df_lookup': df_tax, 
+						'col_min': 'MIN', 'col_max': 'MAX', 'col_out': 'RATE'}, 'TAX_RATE'),
+					(outlier_whisker_multi, {'columns': ['INCOME'], 'output': 'label'}, ['INCOME_OL']) ]
+		* run_csv_pipeline('income.csv', steps, outpath='income_out.csv', required_cols=['INCOME'])
+
+	--- return:
+	* output file path if outpath is given, else the concatenated data frame
+	'''
+	import concurrent.futures
+
+	if n_jobs is None:
+		n_jobs = os.cpu_count() or 1
+	if max_inflight is None:
+		max_inflight = 2 * n_jobs
+	if outpath!='' and os.path.exists(outpath):
+		os.remove(outpath)
+
+	list_df = []
+	def collect(df, first):
+		if outpath!='':
+			df.to_csv(outpath, mode='w' if first else 'a', header=first, index=False)
+		else:
+			list_df.append(df)
+
+	reader = pd.read_csv(filepath, chunksize=chunksize, **read_kw)
+	n_done = 0
+	if n_jobs == 1:
+		for df in reader:
+			collect(_run_steps(df, steps, required_cols), n_done == 0)
+			n_done += 1
+	else:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as pool:
+			inflight = collections.deque()
+			for df in reader:
+				if len(inflight) >= max_inflight: 		# wait for the oldest chunk
+					collect(inflight.popleft().result(), n_done == 0)
+					n_done += 1
+				inflight.append(pool.submit(_run_steps, df, steps, required_cols))
+			while inflight:
+				collect(inflight.popleft().result(), n_done == 0)
+				n_done += 1
+	logger.info('run_csv_pipeline: %d chunks processed' %n_done)
+
+	if outpath!='':
+		return os.path.abspath(outpath)
+	return pd.concat(list_df) if list_df else pd.DataFrame()
+
+
+def _run_steps(df, steps, required_cols=[]):
+	''' apply the run_csv_pipeline() steps to one chunk '''
+	if required_cols:
+		missing = check_missingcols(df, list(required_cols))
+		if missing:
+			raise ValueError('Missing columns: %s' %missing)
+	for step in steps:
+		if callable(step):
+			step = (step, {})
+		func, kwargs, out = (tuple(step) + (None,))[:3]
+		result = func(df, **kwargs)
+		if out is None:
+			if not isinstance(result, pd.DataFrame):
+				raise TypeError('Step %s must return a data frame, or set its output column' %func.__name__)
+			df = result
+		elif isinstance(out, str):
+			df[out] = result
+		elif isinstance(result, pd.DataFrame): 	# column by column: keeps their dtypes
+			for i, c in enumerate(out):
+				df[c] = result.iloc[:, i].array
+		else:
+			df[list(out)] = np.asarray(result)
+	return df
+
+
+def lookup_valrange_vec(df, col_value, df_lookup, col_min, col_max, col_out, ge=True, le=True, firstentry='first'):
+	''' Whole-column version of lookup_valrange(). For each value in df[col_value],
+		lookup for the range bracket in df_lookup and return the df_lookup[col_out]
+		corresponding to that value range, for all rows in one call.
+	* Same output as lookup_valrange: string, '' when not numeric or no match
+	* The bracket edges are sorted once and each value is located with np.searchsorted,
+		i.e. O(rows * log(brackets)) instead of one df_lookup.query() per row
+
+	--- inputs:
+	* df 			: data frame
+	* col_value 	: column name of the values to be looked up
+	* df_lookup 	: lookup data frame with the range brackets
+	* col_min 		: column name of the bracket lower edge in df_lookup
+	* col_max 		: column name of the bracket upper edge in df_lookup
+	* col_out 		: column name of the output value in df_lookup
+	* OPT: ge 		: greater than and equal to col_min, otherwise strictly greater than
+	* OPT: le 		: less than and equal to col_max, otherwise strictly less than
+	* OPT: firstentry : behavior when there're duplicate matches:
+			* 'first' 	: get the first match (df_lookup row order)
+			* 'last' 	: get the last match (df_lookup row order). NOTE: unlike 
+							lookup_valrange(), which returns the first match with a
+							distinct col_out value there
+			* 'none' 	: return string 'DUPLICATE <N duplicates>' when there's duplicate
+
+	--- return:
+	* series of strings, with the same index as df
+
+	To reuse the same df_lookup for many calls, build a ValrangeIndex once instead.
+	'''
+	if not isinstance(df, pd.DataFrame):
+		raise TypeError('Input df must be a Pandas data frame')
+
+	valrange_index = ValrangeIndex(df_lookup, col_min, col_max, col_out, ge=ge, le=le)
+	return valrange_index.lookup(df[col_value], firstentry=firstentry)
+
+
+class ValrangeIndex(object):
+	''' Prebuilt range bracket lookup, i.e. lookup_valrange_vec() without rebuilding
+		the brackets on every call. Build once from df_lookup, then call lookup() on 
+		scalars, arrays, or series.
+	* Overlapping brackets are detected at build time: self.overlap is True and a
+		warning is logged
+	* Picklable (plain numpy arrays). save() writes the arrays as .npy files into a 
+		directory, load(mmap_mode='r') memory-maps them so that worker processes share 
+		the same pages instead of each unpickling a copy
+
+	--- inputs:
+	* df_lookup 	: lookup data frame with the range brackets
+	* col_min 		: column name of the bracket lower edge in df_lookup
+	* col_max 		: column name of the bracket upper edge in df_lookup
+	* col_out 		: column name of the output value in df_lookup
+	* OPT: ge 		: greater than and equal to col_min, otherwise strictly greater than
+	* OPT: le 		: less than and equal to col_max, otherwise strictly less than
+
+	EXAMPLE:
+		* vri = ValrangeIndex(df_tax, 'MIN_INCOME_BRACKET', 'MAX_INCOME_BRACKET', 'TAX_RATE', ge=False)
+		* vri.save('tax_index')
+		* (in the workers) vri = ValrangeIndex.load('tax_index')
+		* df['TAX'] = vri.lookup(df['INCOME'], firstentry='none')
+	'''
+	_arrays = ['edges', 'count', 'first', 'last', 'out']
+
+	def __init__(self, df_lookup, col_min, col_max, col_out, ge=True, le=True):
+		if not isinstance(df_lookup, pd.DataFrame):
+			raise TypeError('Input df_lookup must be a Pandas data frame')
+
+		# --- bracket edges, dropping brackets that can never match ---
+		lo = pd.to_numeric(df_lookup[col_min], errors='coerce').values.astype(float)
+		hi = pd.to_numeric(df_lookup[col_max], errors='coerce').values.astype(float)
+		valid = ~(np.isnan(lo) | np.isnan(hi))
+		self.edges = np.unique(np.concatenate([lo[valid], hi[valid]]))
+		self.out = np.array([str(x) for x in df_lookup[col_out]], dtype=np.str_)
+
+		# --- classes: 2k+1 = exactly on edges[k], 2k = strictly between edges[k-1] and edges[k]
+		n_class = 2 * len(self.edges) + 1
+		self.count = np.zeros(n_class, dtype=np.int64)
+		self.first = np.full(n_class, -1, dtype=np.int64)
+		self.last = np.full(n_class, -1, dtype=np.int64)
+		for i in np.flatnonzero(valid):
+			start = 2 * np.searchsorted(self.edges, lo[i]) + (1 if ge else 2)
+			stop = 2 * np.searchsorted(self.edges, hi[i]) + (2 if le else 1)
+			if start >= stop:
+				continue
+			self.count[start:stop] += 1
+			self.first[start:stop][self.first[start:stop] < 0] = i
+			self.last[start:stop] = i
+
+		n_overlap = np.count_nonzero(self.count > 1)
+		if n_overlap > 0:
+			logger.warning('df_lookup has overlapping brackets (%d edge classes with multiple matches)' %n_overlap)
+
+	@property
+	def overlap(self):
+		return bool(len(self.count) and self.count.max() > 1)
+
+	def _classify(self, value):
+		''' edge class of float value(s). NaN = class 0 (no match) '''
+		pos = np.searchsorted(self.edges, value)
+		if len(self.edges) == 0:
+			return np.zeros_like(pos)
+		cls = 2 * pos + (self.edges[np.minimum(pos, len(self.edges) - 1)] == value)
+		return np.where(np.isnan(value), 0, cls)
+
+	def lookup(self, values, firstentry='first'):
+		''' Lookup the bracket output for the input value(s)
+
+		--- inputs:
+		* values 			: scalar, list / numpy array, or series of values
+		* OPT: firstentry 	: behavior when there're duplicate matches, see lookup_valrange_vec()
+
+		--- return:
+		* str for scalar input, series (same index) for series input, otherwise numpy 
+			array of str
+		'''
+		firstentry = firstentry.lower()
+		if not firstentry in ['first', 'last', 'none']:
+			raise ValueError('Valid choice for firstentry are: "first", "last", or "none"')
+
+		# --- scalar fast path, no pandas overhead ---
+		if np.ndim(values) == 0:
+			try:
+				value = float(values)
+			except (ValueError, TypeError):  # if not numeric, return empty string
+				return ''
+			cls = int(self._classify(value))
+			n_match = self.count[cls]
+			if n_match < 1:
+				return ''
+			if n_match > 1 and firstentry=='none':
+				return 'DUPLICATE ' + str(n_match)
+			return str(self.out[self.first[cls] if firstentry=='first' else self.last[cls]])
+
+		value = pd.to_numeric(pd.Series(values) if not isinstance(values, pd.Series) else values,
+								errors='coerce').values.astype(float)
+		cls = self._classify(value)
+		n_match = self.count[cls]
+		idx = self.first[cls] if firstentry=='first' else self.last[cls]
+		result = np.full(len(value), '', dtype=object)
+		has_match = n_match > 0
+		result[has_match] = self.out[idx[has_match]]
+		if firstentry=='none':
+			dup = n_match > 1
+			result[dup] = ['DUPLICATE ' + str(n) for n in n_match[dup]]
+
+		if isinstance(values, pd.Series):
+			return pd.Series(result, index=values.index, name=values.name)
+		return result
+
+	def save(self, dirpath):
+		''' Save the index as .npy files in dirpath (created if not exist), for load() '''
+		if not os.path.isdir(dirpath):
+			os.makedirs(dirpath)
+		for name in self._arrays:
+			np.save(os.path.join(dirpath, name + '.npy'), getattr(self, name))
+		return os.path.abspath(dirpath)
+
+	@classmethod
+	def load(cls, dirpath, mmap_mode='r'):
+		''' Load an index saved with save(). mmap_mode='r' memory-maps the arrays
+			(read-only, shared between processes), None reads them into memory
+		'''
+		self = cls.__new__(cls)
+		for name in cls._arrays:
+			setattr(self, name, np.load(os.path.join(dirpath, name + '.npy'), mmap_mode=mmap_mode))
+		return self
+
+
+def join_rangeoverlap(df_left, col_left_min, col_left_max, df_right, col_right_min, col_right_max,
+						ge=True, le=True, suffixes=('_x', '_y')):
+	''' Join the rows of df_left to the rows of df_right whose ranges overlap, i.e. 
+		the range-to-range counterpart of lookup_valrange_vec(). Many-to-many: a left
+		range spanning several right brackets gets one output row per bracket.
+	* Left ranges are closed: col_left_min <= x <= col_left_max. A left range with
+		min == max behaves as lookup_valrange_vec() on that value
+	* Right ranges (brackets) follow the ge / le options
+	* Sort-and-sweep instead of a cross join: each overlapping pair either has the 
+		right range starting inside the left range, or the left range starting inside
+		the right range, and both are contiguous runs after sorting the starts. Memory
+		is O(rows + output pairs), never rows x rows
+	* Rows with non-numeric / NaN edges or empty ranges are never matched
+
+	--- inputs:
+	* df_left 			: data frame with the ranges to be joined (e.g. events)
+	* col_left_min 		: column name of the range lower edge in df_left
+	* col_left_max 		: column name of the range upper edge in df_left
+	* df_right 			: data frame with the range brackets
+	* col_right_min 	: column name of the bracket lower edge in df_right
+	* col_right_max 	: column name of the bracket upper edge in df_right
+	* OPT: ge 			: greater than and equal to col_right_min, otherwise strictly greater than
+	* OPT: le 			: less than and equal to col_right_max, otherwise strictly less than
+	* OPT: suffixes 	: suffixes for column names present in both data frames
+
+	--- return:
+	* data frame of the joined rows (new index), sorted by df_left row then df_right row
+	'''
+	if not isinstance(df_left, pd.DataFrame) or not isinstance(df_right, pd.DataFrame):
+		raise TypeError('Input df_left and df_right must be Pandas data frames')
+
+	def expand(start, stop):
+		''' concatenation of np.arange(start[i], stop[i]), and the i of each element '''
+		n = np.maximum(stop - start, 0)
+		owner = np.repeat(np.arange(len(n)), n)
+		pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(start, n)
+		return owner, pos
+
+	# --- valid (non-empty, numeric) ranges ---
+	s = pd.to_numeric(df_left[col_left_min], errors='coerce').values.astype(float)
+	e = pd.to_numeric(df_left[col_left_max], errors='coerce').values.astype(float)
+	pos_l = np.flatnonzero(s <= e)
+	s, e = s[pos_l], e[pos_l]
+	mn = pd.to_numeric(df_right[col_right_min], errors='coerce').values.astype(float)
+	mx = pd.to_numeric(df_right[col_right_max], errors='coerce').values.astype(float)
+	pos_r = np.flatnonzero((mn < mx) | ((mn == mx) & ge & le))
+	mn, mx = mn[pos_r], mx[pos_r]
+
+	# --- case A: right range starts inside the left range (s <= mn <= e) ---
+	order_r = np.argsort(mn, kind='mergesort')
+	mn_sorted = mn[order_r]
+	start = np.searchsorted(mn_sorted, s, side='left')
+	stop = np.searchsorted(mn_sorted, e, side='right' if ge else 'left')
+	li_a, pos = expand(start, stop)
+	ri_a = order_r[pos]
+
+	# --- case B: left range starts inside the right range (mn < s <= mx) ---
+	order_l = np.argsort(s, kind='mergesort')
+	s_sorted = s[order_l]
+	start = np.searchsorted(s_sorted, mn, side='right')
+	stop = np.searchsorted(s_sorted, mx, side='right' if le else 'left')
+	ri_b, pos = expand(start, stop)
+	li_b = order_l[pos]
+
+	# --- back to df row positions, in (left, right) order ---
+	li = pos_l[np.concatenate([li_a, li_b])]
+	ri = pos_r[np.concatenate([ri_a, ri_b])]
+	order = np.lexsort((ri, li))
+	li, ri = li[order], ri[order]
+
+	common = set(df_left.columns) & set(df_right.columns)
+	df_l = df_left.iloc[li].reset_index(drop=True)
+	df_r = df_right.iloc[ri].reset_index(drop=True)
+	df_l.columns = [str(c) + suffixes[0] if c in common else c for c in df_l.columns]
+	df_r.columns = [str(c) + suffixes[1] if c in common else c for c in df_r.columns]
+
+	return pd.concat([df_l, df_r], axis=1)
+
+
 
 # =============================================================================
 # ---- df apply functions (to be used with df.apply) ----
@@ -144,7 +883,7 @@ def outlier_whisker(ds, column, n_iqr=1.5):
 
 def lookup_valrange(df, col_value, df_lookup, col_min, col_max, col_out, ge=True, le=True, firstentry='first'):
 	''' 
-	DEPRECATED. USE pandas.cut() instead.
+	DEPRECATED. USE pandas.cut() or lookup_valrange_vec() instead.
 
 	For each value in df[col_value], lookup for the range bracket in df_lookup, 
 	and return the df[col_out] corresponding to that value range.
@@ -175,7 +914,7 @@ def lookup_valrange(df, col_value, df_lookup, col_min, col_max, col_out, ge=True
 	except ValueError:  # if not numeric, return empty string
 		return ''
 
-	if firstentry.lower!='first' and firstentry.lower!='last' and firstentry.lower!='none':
+	if firstentry.lower()!='first' and firstentry.lower()!='last' and firstentry.lower()!='none':
 		logger.error('Invalid input: firstentry = "%s". Accepted values = "first", "last", or "none"' %firstentry)
 
 	if ge and le:
@@ -214,4 +953,19 @@ def lookup_valrange(df, col_value, df_lookup, col_min, col_max, col_out, ge=True
 # 									VERSION CHANGE
 #=========================================================================================
 # 06 Jun 2015	| V 1.0.0	|	First version
+# 17 Oct 2026	| V 1.1.0	|	Add lookup_valrange_vec (whole-column bracket lookup)
+# 17 Oct 2026	| V 1.2.0	|	Add ValrangeIndex (prebuilt, picklable, mmap-able bracket lookup)
+# 17 Oct 2026	| V 1.3.0	|	Add join_rangeoverlap (sort-and-sweep range overlap join)
+# 17 Oct 2026	| V 1.4.0	|	df_explode: vectorized, multi-column, optional pyarrow engine
+# 17 Oct 2026	| V 1.5.0	|	df_explode_col: keep index alignment, preallocated dtype mode
+# 17 Oct 2026	| V 1.6.0	|	Add QuantileSketch, outlier_whisker_stream. Fix outlier_whisker fences
+# 17 Oct 2026	| V 1.7.0	|	Add outlier_whisker_multi (many columns / groups in one pass)
+# 17 Oct 2026	| V 1.8.0	|	Add check_schema (header + sample csv validation, cached)
+# 17 Oct 2026	| V 1.9.0	|	Add run_csv_pipeline (chunked csv processing in a process pool)
+# 17 Oct 2026	| V 1.9.1	|	lookup_valrange_vec / ValrangeIndex: firstentry='last' is the last match
+#				|			|	(lookup_valrange: first distinct match). Fix lookup_valrange firstentry check
+# 17 Oct 2026	| V 1.9.2	|	df_explode: keep the extension dtypes (tz, category, string) of the other columns
+# 17 Oct 2026	| V 1.9.3	|	check_schema: fix cache key for list / dict read_csv arguments
+# 17 Oct 2026	| V 1.9.4	|	df_explode_col: fix dtype mode with lists longer than the width
+# 17 Oct 2026	| V 1.9.5	|	run_csv_pipeline: keep the dtypes of a data frame step output
 #=========================================================================================
@@ -0,0 +1,68 @@
+#=========================================================================================
+# lib_general_pandas_bench.py
+# V 0.1.0
+# N. Edwin Widjonarko
+#
+# Timing of the lib_general_pandas functions against their pandas counterparts.
+# Run as a script: python lib_general_pandas_bench.py
+#=========================================================================================
+
+import os, sys
+import time
+import numpy as np
+import pandas as pd
+import logging
+
+from lib_general_pandas import *
+
+# ---- setup logging ----
+logger = logging.getLogger(__name__)
+
+
+def timeit(func, *args, **kwargs):
+	''' run func once, return (seconds, output) '''
+	t0 = time.time()
+	out = func(*args, **kwargs)
+	return time.time() - t0, out
+
+
+# ---- test data ----
+n_rows = 1000000
+max_len = 10
+rng = np.random.RandomState(0)
+lengths = rng.randint(1, max_len, n_rows)
+df_data = pd.DataFrame(
+	{	'key' 	: np.arange(n_rows),
+		'list1' : [list(range(n)) for n in lengths],
+		'list2' : [['x'] * n for n in lengths]
+	}
+)
+print('%d rows, %d list elements' %(n_rows, lengths.sum()))
+
+
+# --- df_explode vs DataFrame.explode ---
+t_pd, df_pd = timeit(df_data.explode, ['list1', 'list2'])
+print('DataFrame.explode             : %.2f s' %t_pd)
+t_lib, df_lib = timeit(df_explode, df_data, ['list1', 'list2'], engine='numpy')
+print('df_explode (numpy)            : %.2f s' %t_lib)
+try:
+	import pyarrow as pa
+except ImportError:
+	print('df_explode (arrow)            : skipped, pyarrow not installed')
+else:
+	t_lib, df_lib = timeit(df_explode, df_data, ['list1', 'list2'], engine='arrow')
+	print('df_explode (arrow)            : %.2f s' %t_lib)
+	df_arrow = df_data.astype({	'list1' : pd.ArrowDtype(pa.list_(pa.int64())),
+								'list2' : pd.ArrowDtype(pa.list_(pa.string())) })
+	t_pd, df_pd = timeit(df_arrow.explode, ['list1', 'list2'])
+	print('DataFrame.explode, ArrowDtype : %.2f s' %t_pd)
+	t_lib, df_lib = timeit(df_explode, df_arrow, ['list1', 'list2'])
+	print('df_explode, ArrowDtype        : %.2f s' %t_lib)
+
+
+
+#=========================================================================================
+# 									VERSION CHANGE
+#=========================================================================================
+# 17 Oct 2026	| V 0.1.0	|	First version, df_explode
+#=========================================================================================
@@ -1,6 +1,6 @@
 #=========================================================================================
-# lib_analyse_hourly.py
-# V 0.1.0
+# lib_general_pandas_test.py
+# V 0.11.0
 # N. Edwin Widjonarko
 #=========================================================================================
 
@@ -36,12 +36,382 @@ df_data = pd.DataFrame(
 df_data['tax'] = df_data.apply(lookup_valrange, axis=1, args=('income2', df_lookup, 'income_min', 'income_max', 'tax_rate'))
 
 
-print df_data
+print(df_data)
 
 
+# --- lookup_valrange_vec ---
+df_data['tax_vec'] = lookup_valrange_vec(df_data, 'income', df_lookup, 'income_min', 'income_max', 'tax_rate')
+print(df_data)
+
+
+class TestLookupValrangeVec(unittest.TestCase):
+	''' lookup_valrange_vec() against the row by row lookup_valrange() '''
+	def setUp(self):
+		rng = np.random.RandomState(0)
+		lo = rng.randint(0, 20, 12)
+		# overlapping brackets, shared edges and an empty bracket
+		self.df_lookup = pd.DataFrame(
+			{	'lo' 	: list(lo) + [5],
+				'hi' 	: list(lo + rng.randint(0, 8, 12)) + [3],
+				'out' 	: list('abcdefghijkl') + ['m']
+			}
+		)
+		values = list(np.arange(-1, 30, 0.5)) + [np.nan, 'abc', '7']
+		self.df = pd.DataFrame({'value' : pd.Series(values, dtype=object)})
+
+	def check(self, ge, le, firstentry):
+		df_lookup = self.df_lookup
+		if firstentry=='last': 	# the last match = the first match in reversed df_lookup
+			df_lookup, firstentry_ref = df_lookup.iloc[::-1], 'first'
+		else:
+			firstentry_ref = firstentry
+		result = lookup_valrange_vec(self.df, 'value', self.df_lookup, 'lo', 'hi', 'out', ge=ge, le=le,
+								firstentry=firstentry)
+		is_nan = self.df['value'].isna() 	# lookup_valrange cannot query NaN
+		self.assertTrue((result[is_nan]=='').all())
+		expected = self.df[~is_nan].apply(lookup_valrange, axis=1, args=('value', df_lookup, 'lo', 'hi', 'out',
+								ge, le, firstentry_ref))
+		self.assertEqual(list(result[~is_nan]), list(expected), (ge, le, firstentry))
+
+	def test_all_options(self):
+		for ge in [True, False]:
+			for le in [True, False]:
+				for firstentry in ['first', 'last', 'none']:
+					self.check(ge, le, firstentry)
+
+	def test_scalar(self):
+		vri = ValrangeIndex(self.df_lookup, 'lo', 'hi', 'out')
+		result = lookup_valrange_vec(self.df, 'value', self.df_lookup, 'lo', 'hi', 'out')
+		self.assertEqual([vri.lookup(v) for v in self.df['value']], list(result))
+		self.assertEqual(vri.lookup(np.nan), '')
+		self.assertEqual(vri.lookup('abc'), '')
+
+	def test_save_load(self):
+		import pickle
+		import shutil
+		import tempfile
+		vri = ValrangeIndex(self.df_lookup, 'lo', 'hi', 'out', ge=False)
+		self.assertTrue(vri.overlap)
+		tmpdir = tempfile.mkdtemp()
+		try:
+			self.assertEqual(vri.save(os.path.join(tmpdir, 'idx')), os.path.join(tmpdir, 'idx'))
+			for mmap_mode in ['r', None]:
+				loaded = ValrangeIndex.load(os.path.join(tmpdir, 'idx'), mmap_mode=mmap_mode)
+				self.assertEqual(isinstance(loaded.edges, np.memmap), mmap_mode=='r')
+				self.assertTrue(loaded.overlap)
+				for firstentry in ['first', 'last', 'none']:
+					expected = vri.lookup(self.df['value'], firstentry=firstentry)
+					pd.testing.assert_series_equal(loaded.lookup(self.df['value'], firstentry=firstentry), expected)
+					self.assertEqual(list(loaded.lookup(self.df['value'].values, firstentry)), list(expected))
+				self.assertEqual(loaded.lookup(7), vri.lookup(7))
+			copy = pickle.loads(pickle.dumps(loaded))
+			pd.testing.assert_series_equal(copy.lookup(self.df['value']), vri.lookup(self.df['value']))
+		finally:
+			shutil.rmtree(tmpdir, ignore_errors=True)
+
+	def test_nonnumeric_bracket(self):
+		''' brackets with non-numeric edges never match (lookup_valrange cannot query them) '''
+		df_lookup = pd.DataFrame({'lo' : [0, 'x'], 'hi' : [10, 20], 'out' : ['a', 'b']})
+		result = lookup_valrange_vec(pd.DataFrame({'value' : [5, 15]}), 'value', df_lookup, 'lo', 'hi', 'out')
+		self.assertEqual(list(result), ['a', ''])
+
+
+class TestJoinRangeoverlap(unittest.TestCase):
+	''' join_rangeoverlap() against a brute-force cross join '''
+	def test_against_cross_join(self):
+		rng = np.random.RandomState(1)
+		a = rng.randint(0, 30, 200).astype(float)
+		df_left = pd.DataFrame({'a' : a, 'b' : a + rng.randint(-2, 6, 200), 'lid' : np.arange(200)})
+		df_left.loc[3, 'a'] = np.nan
+		c = rng.randint(0, 30, 50).astype(float)
+		df_right = pd.DataFrame({'c' : c, 'd' : c + rng.randint(-1, 5, 50), 'rid' : np.arange(50)})
+		df_right['c'] = df_right['c'].astype(object)
+		df_right.loc[7, 'c'] = 'x'
+
+		for ge in [True, False]:
+			for le in [True, False]:
+				expected = set()
+				for l in df_left.itertuples():
+					for r in df_right.itertuples():
+						if np.isnan(l.a) or r.c=='x' or not l.a <= l.b:
+							continue
+						if not (r.c <= r.d if ge and le else r.c < r.d):
+							continue
+						if (l.b >= r.c if ge else l.b > r.c) and (l.a <= r.d if le else l.a < r.d):
+							expected.add((l.lid, r.rid))
+				df_join = join_rangeoverlap(df_left, 'a', 'b', df_right, 'c', 'd', ge=ge, le=le)
+				result = list(zip(df_join['lid'], df_join['rid']))
+				self.assertEqual(len(result), len(set(result)))
+				self.assertEqual(set(result), expected, (ge, le))
+				self.assertEqual(result, sorted(result))
+
+	def test_suffixes(self):
+		df = pd.DataFrame({'lo' : [0, 5], 'hi' : [4, 9], 'v' : [1, 2]})
+		df_join = join_rangeoverlap(df, 'lo', 'hi', df, 'lo', 'hi', suffixes=('_l', '_r'))
+		self.assertEqual(list(df_join['v_l']), [1, 2])
+		self.assertEqual(list(df_join['v_r']), [1, 2])
+
+
+class TestDfExplode(unittest.TestCase):
+	''' df_explode() against DataFrame.explode '''
+	def test_against_explode(self):
+		df = pd.DataFrame(
+			{	'key' 	: [10, 20, 30],
+				'list1' : [[1, 2], [3], [4, 5, 6]],
+				'when' 	: pd.to_datetime(['2020-01-01', '2020-06-01', '2021-01-01']).tz_localize('Europe/Paris'),
+				'cat' 	: pd.Categorical(['a', 'b', 'a']),
+				'name' 	: pd.array(['x', None, 'z'], dtype='string'),
+				'list2' : [['a', 'b'], ['c'], ['d', 'e', 'f']]
+			}, index=[5, 3, 5]
+		)
+		for engine in ['numpy', 'auto']:
+			for cols in [['list1', 'list2'], ['list1']]:
+				result = df_explode(df, cols, engine=engine)
+				expected = df.explode(cols)
+				# exploded columns: object here, pandas may infer their dtype
+				pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+				others = [c for c in df.columns if not c in cols]
+				pd.testing.assert_frame_equal(result[others], expected[others])
+		self.assertEqual(result['when'].dtype, df['when'].dtype)
+		self.assertEqual(str(result['when'].iloc[0]), '2020-01-01 00:00:00+01:00')
+
+
+class TestDfExplodeCol(unittest.TestCase):
+	''' df_explode_col() dtype mode against a python padding / cut of the lists '''
+	def setUp(self):
+		self.df = pd.DataFrame(
+			{	'key' 	: [1, 2, 3, 4, 5],
+				'l' 	: [[1, 2, 3, 4], [5, 6], [], [7], [8, 9, 10]]
+			}, index=['e', 'c', 'a', 'd', 'b']
+		)
+
+	def expected(self, width, header=None, fill_value=np.nan):
+		rows = [(list(x) + [fill_value] * width)[:width] for x in self.df['l']]
+		df_out = pd.DataFrame(rows, index=self.df.index, columns=header, dtype=float)
+		return pd.concat([self.df[['key']], df_out], axis=1)
+
+	def test_ragged(self):
+		result = df_explode_col(self.df, 'l', dtype=float)
+		pd.testing.assert_frame_equal(result, self.expected(4))
+
+	def test_max_width(self):
+		result = df_explode_col(pd.DataFrame({'l' : [[1, 2, 3, 4], [5, 6]]}), 'l', dtype=float, max_width=2)
+		self.assertEqual(result.values.tolist(), [[1., 2.], [5., 6.]])
+		for width in [1, 2, 3]:
+			result = df_explode_col(self.df, 'l', dtype=float, max_width=width)
+			pd.testing.assert_frame_equal(result, self.expected(width))
+
+	def test_short_header(self):
+		result = df_explode_col(self.df, 'l', header=['a', 'b'], dtype=float)
+		pd.testing.assert_frame_equal(result, self.expected(2, ['a', 'b']))
+
+	def test_mem_budget(self):
+		for mem_budget in [1, 50, 100, 10**6]:
+			result = df_explode_col(self.df, 'l', dtype=float, max_width=3, mem_budget=mem_budget)
+			pd.testing.assert_frame_equal(result, self.expected(3))
+
+	def test_int_fill(self):
+		result = df_explode_col(self.df, 'l', dtype='int32', fill_value=-1, max_width=2)
+		self.assertEqual(result[[0, 1]].values.tolist(), [[1, 2], [5, 6], [-1, -1], [7, -1], [8, 9]])
+		self.assertEqual(list(result.index), list(self.df.index))
+		with self.assertRaises(ValueError):
+			df_explode_col(self.df, 'l', dtype='int32')
+
+	def test_against_list_mode(self):
+		df = pd.DataFrame({'l' : [[1, 2], [3, 4]]}, index=[7, 3])
+		pd.testing.assert_frame_equal(df_explode_col(df, 'l', dtype='int64', fill_value=0),
+										df_explode_col(df, 'l'))
+
+
+class TestOutlierWhiskerMulti(unittest.TestCase):
+	''' outlier_whisker_multi() against outlier_whisker() per column and group '''
+	def setUp(self):
+		rng = np.random.RandomState(2)
+		n = 3000
+		self.df = pd.DataFrame(
+			{	'g' 	: rng.choice(['a', 'b', 'c', None], n),
+				'h' 	: rng.randint(0, 2, n),
+				'x' 	: rng.standard_t(3, n),
+				'y' 	: rng.exponential(size=n) * 10
+			}, index=rng.permutation(n) + 100
+		)
+		self.df.loc[self.df.index[::50], 'x'] = np.nan
+
+	def check(self, by):
+		top, btm = outlier_whisker_multi(self.df, ['x', 'y'], by=by)
+		labels = outlier_whisker_multi(self.df, ['x', 'y'], by=by, output='label')
+		groups = [(None, self.df)] if by is None else self.df.groupby(by)
+		in_group = pd.Series(False, index=self.df.index)
+		for _, df_g in groups:
+			in_group[df_g.index] = True
+			for col in ['x', 'y']:
+				ref_top, ref_btm, ref_no = outlier_whisker(df_g, col)
+				self.assertEqual(set(top[col][df_g.index].index[top[col][df_g.index]]), set(ref_top.index))
+				self.assertEqual(set(btm[col][df_g.index].index[btm[col][df_g.index]]), set(ref_btm.index))
+				lab = labels[col][df_g.index]
+				self.assertEqual(set(lab.index[lab=='none']), set(ref_no.index))
+				self.assertEqual(set(lab.index[lab.isnull()]), set(df_g.index[df_g[col].isnull()]))
+		for col in ['x', 'y']: 		# rows without group (NaN key): never outliers, label NaN
+			self.assertFalse((top[col] | btm[col])[~in_group].any())
+			self.assertTrue(labels[col][~in_group].isnull().all())
+		self.assertEqual(list(labels.columns), ['x', 'y'])
+		self.assertTrue(all(str(t)=='category' for t in labels.dtypes))
+		self.assertEqual(list(top.index), list(self.df.index))
+
+	def test_whole(self):
+		self.check(None)
+		self.assertTrue(outlier_whisker_multi(self.df, 'y')[0]['y'].any())
+
+	def test_groups(self):
+		self.check('g')
+		self.check(['g', 'h'])
+		with self.assertRaises(ValueError):
+			outlier_whisker_multi(self.df, ['x'], output='frame')
+
+
+class TestQuantileSketch(unittest.TestCase):
+	''' QuantileSketch rank error, merge and pickle, outlier_whisker_stream '''
+	def setUp(self):
+		rng = np.random.RandomState(1)
+		self.data = np.concatenate([rng.normal(size=100000), rng.exponential(size=50000)])
+		rng.shuffle(self.data)
+		self.sorted = np.sort(self.data)
+
+	def check_ranks(self, sketch, k=200):
+		for q, value in zip([0.01, 0.25, 0.5, 0.75, 0.99], sketch.quantile([0.01, 0.25, 0.5, 0.75, 0.99])):
+			rank = np.searchsorted(self.sorted, value, side='right') / float(len(self.sorted))
+			self.assertTrue(abs(rank - q) <= 2.65 / k, (q, rank))
+
+	def test_rank_bound(self):
+		sketch = QuantileSketch(seed=0)
+		for chunk in np.array_split(self.data, 37):
+			sketch.update(chunk)
+		self.assertEqual(sketch.n, len(self.data))
+		self.assertTrue(sum(len(level) for level in sketch.levels) < 3 * 200 + 2 * len(sketch.levels))
+		self.check_ranks(sketch)
+		self.assertIsInstance(sketch.quantile(0.5), float)
+
+	def test_merge_pickle(self):
+		import pickle
+		import functools
+		sketches = [QuantileSketch(seed=i).update(chunk) for i, chunk in enumerate(np.array_split(self.data, 4))]
+		sketches = [pickle.loads(pickle.dumps(x)) for x in sketches] 	# e.g. from worker processes
+		sketch = functools.reduce(QuantileSketch.merge, sketches)
+		self.assertEqual(sketch.n, len(self.data))
+		self.check_ranks(sketch)
+		copy = pickle.loads(pickle.dumps(sketch))
+		np.testing.assert_array_equal(copy.quantile([0.25, 0.75]), sketch.quantile([0.25, 0.75]))
+		with self.assertRaises(TypeError):
+			sketch.merge([1, 2])
+
+	def test_nan_empty(self):
+		sketch = QuantileSketch().update([np.nan, 1., 2., np.nan, 3.])
+		self.assertEqual((sketch.n, sketch.quantile(0.5)), (3, 2.))
+		self.assertTrue(np.isnan(QuantileSketch().quantile(0.5)))
+		self.assertTrue(np.isnan(QuantileSketch().quantile([0.25, 0.75])).all())
+
+	def test_stream(self):
+		df = pd.DataFrame({'v' : np.concatenate([self.data[:20000], [-50., 60., 70.]])})
+		chunks = [df.iloc[i:i + 3000] for i in range(0, len(df), 3000)]
+		top, btm, _ = outlier_whisker(df, 'v')
+		out = list(outlier_whisker_stream(chunks, 'v'))
+		self.assertEqual(len(out), len(chunks))
+		self.assertEqual(sum(len(x[0]) + len(x[1]) + len(x[2]) for x in out), len(df))
+		self.assertTrue(set([60., 70.]) <= set(pd.concat([x[0] for x in out])))
+		self.assertTrue(-50. in set(pd.concat([x[1] for x in out])))
+		n_ol = sum(len(x[0]) + len(x[1]) for x in out)
+		self.assertTrue(abs(n_ol - (len(top) + len(btm))) <= 0.05 * (len(top) + len(btm)) + 5)
+		with self.assertRaises(TypeError):
+			list(outlier_whisker_stream(iter(chunks), 'v'))
+
+
+class TestRunCsvPipeline(unittest.TestCase):
+	''' run_csv_pipeline(): input order, pool against no pool, output dtypes '''
+	def setUp(self):
+		import tempfile
+		self.tmpdir = tempfile.mkdtemp()
+		self.fpath = os.path.join(self.tmpdir, 'income.csv')
+		rng = np.random.RandomState(0)
+		income = rng.randint(50, 650, 1000).astype(float)
+		income[::97] = 5000.
+		pd.DataFrame({'id' : np.arange(1000), 'income' : income}).to_csv(self.fpath, index=False)
+		self.steps = [
+			(lookup_valrange_vec, {'col_value' : 'income', 'df_lookup' : df_lookup, 'col_min' : 'income_min',
+									'col_max' : 'income_max', 'col_out' : 'tax_rate'}, 'tax'),
+			(outlier_whisker_multi, {'columns' : ['income'], 'output' : 'label'}, ['income_ol'])]
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+	def test_pool(self):
+		df_1 = run_csv_pipeline(self.fpath, self.steps, chunksize=90, n_jobs=1)
+		self.assertEqual(list(df_1['id']), list(range(1000)))
+		self.assertEqual(str(df_1['income_ol'].dtype), 'category')
+		self.assertEqual(set(df_1['income_ol'].iloc[::97]), set(['top']))
+		for n_jobs, max_inflight in [(3, None), (2, 1)]:
+			df_n = run_csv_pipeline(self.fpath, self.steps, chunksize=90, n_jobs=n_jobs, max_inflight=max_inflight)
+			pd.testing.assert_frame_equal(df_n, df_1)
+
+	def test_outpath(self):
+		outpath = os.path.join(self.tmpdir, 'out.csv')
+		self.assertEqual(run_csv_pipeline(self.fpath, self.steps, chunksize=300, n_jobs=2, outpath=outpath),
+						outpath)
+		df_1 = run_csv_pipeline(self.fpath, self.steps, chunksize=300, n_jobs=1)
+		df_out = pd.read_csv(outpath, keep_default_na=False)
+		self.assertEqual(list(df_out['id']), list(range(1000)))
+		self.assertEqual(list(df_out['income_ol']), [str(x) for x in df_1['income_ol']])
+		with self.assertRaises(ValueError):
+			run_csv_pipeline(self.fpath, self.steps, n_jobs=1, required_cols=['nothere'])
+
+
+class TestCheckSchema(unittest.TestCase):
+	''' check_schema() with list / dict read_csv arguments and its sample cache '''
+	def setUp(self):
+		import tempfile
+		fd, self.fpath = tempfile.mkstemp(suffix='.csv')
+		with os.fdopen(fd, 'w') as f:
+			f.write('id,amount,when,note\n1,2.5,2020-01-01,a\n2,NA,2020-01-02,\n')
+
+	def tearDown(self):
+		os.remove(self.fpath)
+
+	def test_unhashable_read_kw(self):
+		for _ in range(2): 	# second call from the cache
+			problems = check_schema(self.fpath, ['id'], {'amount' : 'float', 'when' : 'datetime'},
+						usecols=['id', 'amount', 'when'], dtype={'id' : 'int64'}, na_values=['NA'])
+			self.assertEqual(problems, [])
+		problems = check_schema(self.fpath, ['note'], usecols=['id', 'amount'])
+		self.assertEqual(problems, ['missing column "note"'])
+		self.assertEqual(check_schema(self.fpath, notnull=['amount'], na_values=['NA']),
+						['column "amount" has null values'])
+		self.assertEqual(check_schema(self.fpath, ['id'], converters={'id' : lambda x: x}), [])
+
+	def test_cache_invalidated(self):
+		self.assertEqual(check_schema(self.fpath, ['extra'], usecols=[0, 1]), ['missing column "extra"'])
+		with open(self.fpath, 'w') as f:
+			f.write('extra,id\n1,2\n')
+		os.utime(self.fpath, ns=(0, 10**18))
+		self.assertEqual(check_schema(self.fpath, ['extra'], usecols=[0, 1]), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
+
 
 #=========================================================================================
 # 									VERSION CHANGE
 #=========================================================================================
 # 06 Jun 2015	| V 0.1.0	|	First version, beta
-#=========================================================================================
\ No newline at end of file
+# 17 Oct 2026	| V 0.2.0	|	Add lookup_valrange_vec
+# 17 Oct 2026	| V 0.3.0	|	python 3 print. lookup_valrange_vec against lookup_valrange, 
+#				|			|	all ge / le / firstentry options, NaN and non-numeric values
+# 17 Oct 2026	| V 0.4.0	|	join_rangeoverlap against a brute-force cross join
+# 17 Oct 2026	| V 0.5.0	|	df_explode against DataFrame.explode, extension dtypes
+# 17 Oct 2026	| V 0.6.0	|	check_schema with list / dict read_csv arguments
+# 17 Oct 2026	| V 0.7.0	|	df_explode_col dtype mode: ragged, max_width, header, mem_budget
+# 17 Oct 2026	| V 0.8.0	|	run_csv_pipeline
+# 17 Oct 2026	| V 0.9.0	|	QuantileSketch, outlier_whisker_stream
+# 17 Oct 2026	| V 0.10.0	|	outlier_whisker_multi, NaN keys and values
+# 17 Oct 2026	| V 0.11.0	|	ValrangeIndex save / load round trip
+#=========================================================================================
@@ -0,0 +1,791 @@
+#=========================================================================================
+# lib_general_test.py
+# V 0.8.10
+# N. Edwin Widjonarko
+#=========================================================================================
+
+import os, sys
+import io
+import re
+import shutil
+import tempfile
+import logging
+import unittest
+
+from lib_general import *
+
+# ---- setup logging ----
+logger = logging.getLogger(__name__)
+
+
+class TmpDirTestCase(unittest.TestCase):
+	''' test case with a fresh temporary directory self.tmpdir '''
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+	def write(self, name, data):
+		''' write bytes data to tmpdir/name, return the path '''
+		path = os.path.join(self.tmpdir, name)
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+
+class TestLineIndex(TmpDirTestCase):
+	''' filelen, build_lineindex, load_lineindex, read_lines '''
+	def test_read_lines(self):
+		lines = [b'line %d\n' %i if i % 3 else b'\n' for i in range(1000)] + [b'no line end']
+		path = self.write('data.txt', b''.join(lines))
+		self.assertEqual(filelen(path), len(lines))
+		self.assertEqual(filelen(path, n_jobs=3, bufsize=64), len(lines))
+		self.assertEqual(build_lineindex(path, bufsize=100), len(lines))
+		offsets = load_lineindex(path)
+		self.assertEqual(len(offsets), len(lines) + 1)
+		self.assertEqual(read_lines(path, 5, 9, encoding=None), lines[5:9])
+		self.assertEqual(read_lines(path, 999, 2000, encoding=None), lines[999:])
+		self.assertEqual(read_lines(path, 2000), [])
+		self.assertEqual(read_lines(path, 1), ['line 1\n'])
+
+	def test_crlf_and_empty(self):
+		path = self.write('crlf.txt', b'a\r\nb\r\n')
+		self.assertEqual(filelen(path), 2)
+		self.assertEqual(read_lines(path, 0, 2), ['a\r\n', 'b\r\n'])
+		self.assertEqual(filelen(self.write('empty.txt', b'')), 0)
+
+	def test_stale_index(self):
+		path = self.write('data.txt', b'a\nb\n')
+		build_lineindex(path)
+		self.write('data.txt', b'x\ny\nz\n')
+		os.utime(path, ns=(0, 10**18))
+		self.assertIsNone(load_lineindex(path))
+		self.assertEqual(read_lines(path, 2), ['z\n']) 	# rebuilt
+
+
+class TestSplitfile(TmpDirTestCase):
+	''' splitfile: by lines, by bytes, with an index, compressed '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.header = b'id,value\n'
+		self.body = [b'%d,%s\n' %(i, b'x' * (i % 17)) for i in range(1001)]
+		self.path = self.write('data.csv', self.header + b''.join(self.body))
+		self.outdir = os.path.join(self.tmpdir, 'out')
+		os.mkdir(self.outdir)
+
+	def check(self, parts, maxlines=None, maxbytes=None, header=True):
+		body = []
+		for outpath, n_lines in parts:
+			with open_file(outpath, 'rb') as f:
+				data = f.read()
+			if header:
+				self.assertTrue(data.startswith(self.header))
+				data = data[len(self.header):]
+			lines = data.splitlines(True)
+			self.assertEqual(len(lines), n_lines)
+			if maxlines is not None:
+				self.assertTrue(0 < n_lines <= maxlines)
+			if maxbytes is not None:
+				self.assertTrue(len(data) <= maxbytes or n_lines == 1)
+			body += lines
+		self.assertEqual(body, self.body if header else [self.header] + self.body)
+
+	def test_maxlines(self):
+		for n_jobs in [1, 4]:
+			parts = splitfile(self.path, 100, self.outdir, n_jobs=n_jobs)
+			self.assertEqual([n for _, n in parts], [100] * 10 + [1])
+			self.check(parts, maxlines=100)
+			for outpath, _ in parts:
+				os.remove(outpath)
+
+	def test_no_header_with_index(self):
+		build_lineindex(self.path)
+		self.check(splitfile(self.path, 333, self.outdir, header=False), maxlines=333, header=False)
+
+	def test_maxbytes(self):
+		self.check(splitfile(self.path, outdir=self.outdir, maxbytes=1000, n_jobs=2), maxbytes=1000)
+
+	def test_compressed(self):
+		with open_file(self.path + '.gz', 'wb') as f:
+			f.write(self.header + b''.join(self.body))
+		parts = splitfile(self.path + '.gz', 250, self.outdir, compress='bz2')
+		self.assertTrue(all(p.endswith('.csv.bz2') for p, _ in parts))
+		self.check(parts, maxlines=250)
+
+
+class TestPartitionfile(TmpDirTestCase):
+	''' partitionfile: key to shard, header, counts, quoted rows '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.header = b'key,sub,value\n'
+		self.body = [b'k%d,%d,%d\n' %(i % 37, i % 3, i) for i in range(2000)]
+		self.body += [b'"k5",1,"a,b"\n', b'"k,x",2,"c ""d"""\n', b'k,x"y,3,4\n']
+		self.outdir = os.path.join(self.tmpdir, 'out')
+		os.mkdir(self.outdir)
+
+	def read_parts(self, parts, header=True):
+		''' [(rows of each part)], checking the header and the counts '''
+		import csv
+		out = []
+		for outpath, n_rows in parts:
+			with open(outpath, 'rb') as f:
+				data = f.read()
+			if header:
+				self.assertTrue(data.startswith(self.header))
+				data = data[len(self.header):]
+			lines = data.splitlines(True)
+			self.assertEqual(len(lines), n_rows)
+			out.append([next(csv.reader([x.decode()])) for x in lines])
+		return out
+
+	def check_keys(self, rows_parts, keyidx):
+		seen = {}
+		for part, rows in enumerate(rows_parts):
+			for row in rows:
+				key = tuple(row[i] for i in keyidx)
+				self.assertEqual(seen.setdefault(key, part), part)
+		return seen
+
+	def test_partition(self):
+		import csv
+		path = self.write('data.csv', self.header + b''.join(self.body))
+		parts = partitionfile(path, 'key', 4, self.outdir)
+		self.assertEqual([os.path.basename(p) for p, _ in parts], ['data_%d.csv' %i for i in range(4)])
+		rows = self.read_parts(parts)
+		self.assertEqual(sum(len(r) for r in rows), len(self.body))
+		self.assertTrue(all(len(r) > 0 for r in rows))
+		seen = self.check_keys(rows, [0])
+		self.assertTrue(['k5', '1', 'a,b'] in rows[seen[('k5',)]]) 	# quoted key, same shard
+		self.assertTrue(['k,x', '2', 'c "d"'] in rows[seen[('k,x',)]]) 	# sep in the quoted key
+		self.assertEqual(sorted(sum(rows, [])), sorted(next(csv.reader([x.decode()])) for x in self.body))
+
+	def test_multi_col_small_buffer(self):
+		path = self.write('data.csv', self.header + b''.join(self.body))
+		parts = partitionfile(path, ['key', 1], 5, self.outdir, maxbuffer=100)
+		rows = self.read_parts(parts)
+		self.check_keys(rows, [0, 1])
+		ref = self.read_parts(partitionfile(path, [0, 'sub'], 5, self.outdir))
+		self.assertEqual(rows, ref) 		# same shards and order with one flush at the end
+
+	def test_no_header_no_last_newline(self):
+		data = b''.join(self.body)[:-1]
+		path = self.write('data.csv', data)
+		parts = partitionfile(path, 0, 3, self.outdir, header=False)
+		out = b''
+		for outpath, _ in parts:
+			with open(outpath, 'rb') as f:
+				out += f.read()
+		self.assertTrue(out.endswith(b'\n'))
+		self.assertEqual(sorted(out.splitlines()), sorted(data.splitlines()))
+		self.assertEqual(sum(n for _, n in parts), len(self.body))
+		with self.assertRaises(ValueError):
+			partitionfile(path, 'key', 3, self.outdir, header=False)
+
+
+class TestSearchpath(TmpDirTestCase):
+	''' searchpath / searchpath_iter: matching, pruning, threads '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		for d in ['a/b/c', 'a/skip/deep', 'd']:
+			os.makedirs(os.path.join(self.tmpdir, d))
+		for f in ['top.csv', 'a/x.csv', 'a/b/y.txt', 'a/b/c/z.csv', 'a/skip/s.csv', 'a/skip/deep/t.csv',
+					'd/w.csv']:
+			self.write(f, b'')
+
+	def rel(self, paths):
+		return sorted(os.path.relpath(p, self.tmpdir) for p in paths)
+
+	def test_iter(self):
+		self.assertEqual(self.rel(searchpath_iter(self.tmpdir, '[.]csv$', 'skip', 'f')),
+						['a/b/c/z.csv', 'a/x.csv', 'd/w.csv', 'top.csv']) 	# skip/deep is pruned
+		self.assertEqual(self.rel(searchpath_iter(self.tmpdir, '', 'skip', 'd')), ['a', 'a/b', 'a/b/c', 'd'])
+		self.assertEqual(self.rel(searchpath_iter(self.tmpdir, '^b$|^s', fileOrDir='df')),
+						['a/b', 'a/skip', 'a/skip/s.csv'])
+		self.assertEqual(self.rel(searchpath_iter(self.tmpdir, '', recursive=False)), ['a', 'd', 'top.csv'])
+		with self.assertRaises(ValueError):
+			list(searchpath_iter(self.tmpdir, fileOrDir='x'))
+
+	def test_threads(self):
+		for args in [('', '', 'df'), ('[.]csv$', 'skip', 'f'), ('', 'b', 'd')]:
+			self.assertEqual(self.rel(searchpath_iter(self.tmpdir, *args, n_jobs=4)),
+							self.rel(searchpath_iter(self.tmpdir, *args)))
+
+	def test_searchpath(self):
+		out = searchpath(self.tmpdir, 'a|[.]csv$')
+		self.assertIsInstance(out, list)
+		self.assertEqual(self.rel(out), ['a', 'top.csv'])
+		self.assertEqual(self.rel(searchpath(self.tmpdir, '', fileOrDir='d')), ['a', 'd'])
+
+
+class TestPathIndex(TmpDirTestCase):
+	''' PathIndex: search against searchpath_iter, incremental refresh '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.top = os.path.join(self.tmpdir, 'top')
+		for d in ['a/b', 'a/skip', 'c/d']:
+			os.makedirs(os.path.join(self.top, d))
+		for f in ['x.csv', 'a/y.csv', 'a/b/z.txt', 'a/skip/s.csv', 'c/d/w.csv']:
+			self.write(os.path.join('top', f), b'data')
+		self.pidx = PathIndex(self.top)
+
+	def tearDown(self):
+		self.pidx.close()
+		TmpDirTestCase.tearDown(self)
+
+	def test_search(self):
+		self.assertTrue(os.path.isfile(self.top + '.pathidx.sqlite'))
+		for args in [('', '', 'df'), ('[.]csv$', 'skip', 'f'), ('', 'b', 'd')]:
+			self.assertEqual(sorted(self.pidx.search(*args)), sorted(searchpath_iter(self.top, *args)))
+		expected = [os.path.join(self.top, 'a', 'y.csv')]
+		self.assertEqual(self.pidx.search('[.]csv$', 'skip', 'f', subdir=os.path.join(self.top, 'a')), expected)
+		cwd = os.getcwd()
+		try:
+			os.chdir(self.tmpdir) 		# relative to the index, not the cwd
+			self.assertEqual(self.pidx.search('[.]csv$', 'skip', 'f', subdir='a'), expected)
+			self.assertEqual(self.pidx.stat('a/y.csv')[:2], ('f', 4))
+		finally:
+			os.chdir(cwd)
+		self.assertEqual(self.pidx.stat(os.path.join(self.top, 'a', 'b'))[0], 'd')
+		self.assertIsNone(self.pidx.stat('nothere'))
+
+	def test_refresh(self):
+		self.assertEqual(self.pidx.refresh(), 0) 	# nothing changed: no directory listed
+		self.write('top/a/b/new.csv', b'')
+		shutil.rmtree(os.path.join(self.top, 'c'))
+		n_scanned = self.pidx.refresh()
+		self.assertEqual(n_scanned, 2) 		# a/b (new file) and top (c removed)
+		self.assertEqual(sorted(self.pidx.search()), sorted(searchpath_iter(self.top)))
+		dirs = [r[0] for r in self.pidx._db.execute('SELECT path FROM dirs')]
+		self.assertFalse(any(d.startswith(os.path.join(self.top, 'c')) for d in dirs))
+
+		with PathIndex(self.top, refresh=False) as pidx: 	# reopened from the file
+			self.assertEqual(sorted(pidx.search('[.]csv$')), sorted(searchpath_iter(self.top, '[.]csv$')))
+			self.assertEqual(pidx.refresh(full=True), 4)
+
+
+class TestGrepFiles(TmpDirTestCase):
+	''' grep_files: line numbers, binary files, limits, threads and processes '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.paths = [self.write('f%d.txt' %i, b''.join(b'line %d%s\n' %(j, b' ERR' if j % 10==i else b'')
+											for j in range(50))) for i in range(6)]
+		self.paths.append(self.write('bin.dat', b'ERR\0ERR\n'))
+		self.paths.append(self.write('empty.txt', b''))
+
+	def expected(self):
+		return sorted((p, j + 1, b'ERR') for i, p in enumerate(self.paths[:6]) for j in range(50) if j % 10==i)
+
+	def test_lines(self):
+		self.assertEqual(sorted(grep_files(self.paths, 'ERR')), self.expected())
+		path = self.write('multi.txt', b'a\r\nb\n\nab ab\n')
+		self.assertEqual(list(grep_files([path], b'ab')), [(path, 4, b'ab'), (path, 4, b'ab')])
+		self.assertEqual(list(grep_files([path], re.compile(b'^B$', re.M), flags=re.I)), [(path, 2, b'b')])
+		with self.assertRaises(TypeError):
+			list(grep_files([path], re.compile('a')))
+
+	def test_pools(self):
+		for processes in [False, True]:
+			out = list(grep_files(self.paths, 'ERR', n_jobs=3, processes=processes))
+			self.assertEqual(sorted(out), self.expected())
+			first = list(grep_files(self.paths, 'ERR', n_jobs=3, processes=processes, first_only=True))
+			self.assertEqual(sorted(first), [(p, i + 1, b'ERR') for i, p in enumerate(self.paths[:6])])
+			self.assertEqual(len(list(grep_files(self.paths, 'ERR', n_jobs=3, processes=processes,
+												max_total=7))), 7)
+		self.assertEqual(len(list(grep_files(self.paths, 'ERR', first_only=True, max_total=2))), 2)
+
+
+class TestCompression(TmpDirTestCase):
+	''' get_compression, open_file and the helpers on compressed / look-alike files '''
+	def test_magic(self):
+		import gzip, bz2, lzma
+		data = b'a,b\n1,2\n'
+		for name, module in [('gzip', gzip), ('bz2', bz2), ('xz', lzma)]:
+			path = self.write('noext_' + name, module.compress(data))
+			self.assertEqual(get_compression(path), name)
+			self.assertEqual(filelen(path), 2)
+			self.assertEqual(b''.join(read_in_chunks(path, 3)), data)
+		self.assertEqual(get_compression(self.write('empty.bz2data', bz2.compress(b''))), 'bz2')
+
+	def test_plain_lookalike(self):
+		for data in [b'BZh-123,ok\nBZh9,x\n', b'BZh91AY\n2\n', b'\x1f\x8bzz\n\n']:
+			path = self.write('plain.csv', data)
+			self.assertIsNone(get_compression(path))
+			self.assertEqual(filelen(path), 2)
+			self.assertEqual(b''.join(read_in_chunks(path, 4)), data)
+
+
+class TestReadintoChunks(TmpDirTestCase):
+	''' readinto_chunks: reused buffer, line mode, buffer growth, mmap '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		lines = [b'x' * (i * 7 % 50) + b'\n' for i in range(300)]
+		lines[100] = b'L' * 1000 + b'\n' 		# longer than chunk_size: the buffer grows
+		self.data = b''.join(lines) + b'no line end'
+		self.path = self.write('data.txt', self.data)
+
+	def test_chunks(self):
+		for use_mmap in [False, True]:
+			for lines in [False, True]:
+				chunks = [bytes(c) for c in readinto_chunks(self.path, 64, lines=lines, use_mmap=use_mmap)]
+				self.assertEqual(b''.join(chunks), self.data)
+				if lines:
+					self.assertTrue(all(c.endswith(b'\n') for c in chunks[:-1]))
+					self.assertTrue(chunks[-1].endswith(b'no line end'))
+					self.assertTrue(any(len(c) > 64 for c in chunks))
+				elif not use_mmap:
+					self.assertTrue(all(len(c) <= 64 for c in chunks))
+
+	def test_file_object(self):
+		with open(self.path, 'rb') as f:
+			chunks = [bytes(c) for c in readinto_chunks(f, 100, lines=True)]
+			self.assertFalse(f.closed)
+		self.assertEqual(b''.join(chunks), self.data)
+		with open_file(self.write('data.txt.gz', b''), 'wb') as f:
+			f.write(self.data)
+		self.assertEqual(b''.join(bytes(c) for c in readinto_chunks(self.path + '.gz', 100)), self.data)
+		self.assertEqual(list(readinto_chunks(self.write('empty', b''), use_mmap=True)), [])
+
+	def test_buffer_reused(self):
+		chunks = list(readinto_chunks(self.write('ab', b'a' * 10 + b'b' * 10), 10))
+		self.assertEqual(len(chunks), 2)
+		self.assertEqual(bytes(chunks[0]), b'b' * 10) 	# the first view now shows the second chunk
+
+
+class SlowFile(object):
+	''' file object with slow reads, records the reads and a close during a read '''
+	def __init__(self, data, delay=0.):
+		self.f = io.BytesIO(data)
+		self.delay = delay
+		self.n_reads = 0
+		self.reading = False
+		self.closed_while_reading = False
+
+	def read(self, n):
+		import time
+		self.reading = True
+		time.sleep(self.delay)
+		self.n_reads += 1
+		self.reading = False
+		return self.f.read(n)
+
+	def close(self):
+		self.closed_while_reading = self.closed_while_reading or self.reading
+		self.f.close()
+
+
+class TestAreadInChunks(TmpDirTestCase):
+	''' aread_in_chunks: data, backpressure, early break / aclose() '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.data = os.urandom(10000)
+		self.path = self.write('data.bin', self.data)
+
+	def run_async(self, coro):
+		import asyncio
+		return asyncio.run(coro)
+
+	def test_read(self):
+		async def read(file_object):
+			return [c async for c in aread_in_chunks(file_object, 1000, prefetch=2)]
+		chunks = self.run_async(read(self.path))
+		self.assertEqual((len(chunks), b''.join(chunks)), (10, self.data))
+		with open_file(self.path + '.gz', 'wb') as f:
+			f.write(self.data)
+		self.assertEqual(b''.join(self.run_async(read(self.path + '.gz'))), self.data)
+		with self.assertRaises(ValueError):
+			self.run_async(aread_in_chunks(self.path, prefetch=0).__anext__())
+
+	def test_backpressure(self):
+		import asyncio
+		f = SlowFile(self.data)
+		async def consume():
+			n_reads = []
+			async for chunk in aread_in_chunks(f, 100, prefetch=3):
+				await asyncio.sleep(0.01)
+				n_reads.append(f.n_reads)
+				if len(n_reads)==5:
+					break
+			return n_reads
+		n_reads = self.run_async(consume())
+		self.assertTrue(max(n_reads) <= 5 + 3 + 1, n_reads) 	# consumed + queue + one in flight
+
+	def test_break_waits_for_read(self):
+		from unittest import mock
+		import lib_general
+		f = SlowFile(self.data, delay=0.2)
+		async def consume():
+			agen = aread_in_chunks(self.path, 100, prefetch=1)
+			async for chunk in agen:
+				break
+			await agen.aclose()
+		with mock.patch.object(lib_general, 'open_file', return_value=f):
+			self.run_async(consume())
+		self.assertTrue(f.f.closed)
+		self.assertFalse(f.closed_while_reading)
+
+
+class TestTailLines(TmpDirTestCase):
+	''' tail_lines: new lines only, checkpoint, truncation, rotation '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.path = os.path.join(self.tmpdir, 'app.log')
+
+	def append(self, data, mode='ab', path=None):
+		with open(path or self.path, mode) as f:
+			f.write(data)
+
+	def test_incremental(self):
+		self.append(b'a\nb\nc', 'wb')
+		self.assertEqual(list(tail_lines(self.path)), [b'a\n', b'b\n']) 	# c is incomplete
+		self.assertEqual(list(tail_lines(self.path)), [])
+		self.append(b'c\nd\n')
+		self.assertEqual(list(tail_lines(self.path, encoding='utf-8')), ['cc\n', 'd\n'])
+		self.assertTrue(os.path.isfile(self.path + '.ckpt'))
+
+	def test_at_least_once(self):
+		self.append(b'e\nf\n', 'wb')
+		for line in tail_lines(self.path):
+			break
+		self.assertEqual(list(tail_lines(self.path)), [b'e\n', b'f\n'])
+
+	def test_truncation(self):
+		self.append(b'1\n2\n', 'wb')
+		list(tail_lines(self.path))
+		self.append(b'x\n', 'wb')
+		self.assertEqual(list(tail_lines(self.path)), [b'x\n'])
+		with open(self.path, 'r+b') as f: 	# copytruncate, then grows past the offset
+			f.truncate(0)
+		self.append(b'yyyy\nz\n')
+		self.assertEqual(list(tail_lines(self.path)), [b'yyyy\n', b'z\n'])
+
+	def test_rotation(self):
+		rotated = self.path + '.1'
+		self.append(b'old\n', 'wb')
+		list(tail_lines(self.path, rotated=rotated))
+		self.append(b'last\n')
+		os.rename(self.path, rotated)
+		self.append(b'new\n', 'wb')
+		self.assertEqual(list(tail_lines(self.path, rotated=rotated)), [b'last\n', b'new\n'])
+		self.append(b'more\n')
+		self.assertEqual(list(tail_lines(self.path, rotated=rotated)), [b'more\n'])
+
+	def test_small_chunks(self):
+		lines = [b'%d\n' %i for i in range(5000)]
+		self.append(b''.join(lines), 'wb')
+		self.assertEqual(list(tail_lines(self.path, chunk_size=16)), lines)
+
+	def test_grows_while_read(self):
+		lines = [b'line %03d %s\n' %(i, b'x' * 20) for i in range(100)]
+		self.append(b''.join(lines[:3]), 'wb') 		# under the 1 KB head when opened
+		out = []
+		for line in tail_lines(self.path, chunk_size=64):
+			out.append(line)
+			if len(out)==3:
+				self.append(b''.join(lines[3:]))
+		self.assertEqual(out, lines)
+		self.assertEqual(list(tail_lines(self.path)), [])
+		self.append(b'next\n')
+		self.assertEqual(list(tail_lines(self.path)), [b'next\n'])
+
+
+class TestCopytreeSync(TmpDirTestCase):
+	''' copytree: full copy, then sync=True with changes '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.src = os.path.join(self.tmpdir, 'src')
+		self.dst = os.path.join(self.tmpdir, 'dst')
+		for d in ['a', 'a/b', 'c']:
+			os.makedirs(os.path.join(self.src, d))
+		self.files = {	'top.txt' 	: b'top',
+						'a/x.txt' 	: b'x' * 100,
+						'a/b/big' 	: os.urandom(2 * 1048576),
+						'c/y.tmp' 	: b'y' }
+		for rel, data in self.files.items():
+			self.write(os.path.join('src', rel), data)
+
+	def tree(self, root):
+		''' {rel path: content} of the files under root, manifest excluded '''
+		out = {}
+		for dirpath, dirnames, filenames in os.walk(root):
+			for name in filenames:
+				if name.startswith('.copytree_manifest'):
+					continue
+				path = os.path.join(dirpath, name)
+				with open(path, 'rb') as f:
+					out[os.path.relpath(path, root)] = f.read()
+		return out
+
+	def test_sync(self):
+		report = copytree(self.src, self.dst, sync=True)
+		self.assertEqual((report['files'], report['skipped'], report['errors']), (4, 0, []))
+		self.assertEqual(self.tree(self.dst), self.files)
+		report = copytree(self.src, self.dst, sync=True)
+		self.assertEqual((report['files'], report['skipped']), (0, 4))
+
+		# changed, new, removed file; touched big file (same content); removed dir
+		self.write('src/top.txt', b'top changed')
+		self.write('src/a/new.txt', b'new')
+		os.remove(os.path.join(self.src, 'a/x.txt'))
+		big = os.path.join(self.src, 'a/b/big')
+		os.utime(big, ns=(0, 10**18))
+		shutil.rmtree(os.path.join(self.src, 'c'))
+		report = copytree(self.src, self.dst, sync=True, delete=True)
+		self.assertEqual((report['files'], report['skipped'], report['deleted']), (2, 1, 3))
+		self.assertEqual(self.tree(self.dst), self.tree(self.src))
+		self.assertFalse(os.path.exists(os.path.join(self.dst, 'c')))
+		self.assertEqual(os.stat(big).st_mtime_ns, os.stat(os.path.join(self.dst, 'a/b/big')).st_mtime_ns)
+
+		# same size, other content, other mtime: the hash finds it
+		with open(big, 'r+b') as f:
+			f.write(b'Z')
+		os.utime(big, ns=(0, 2 * 10**18))
+		report = copytree(self.src, self.dst, sync=True)
+		self.assertEqual(report['files'], 1)
+		self.assertEqual(self.tree(self.dst), self.tree(self.src))
+
+	def test_delete_keeps_ignored(self):
+		copytree(self.src, self.dst, sync=True)
+		report = copytree(self.src, self.dst, sync=True, delete=True, ignore=shutil.ignore_patterns('*.tmp', 'b'))
+		self.assertEqual(report['deleted'], 0)
+		self.assertEqual(self.tree(self.dst), self.files)
+
+	def test_plain_copy(self):
+		report = copytree(self.src, self.dst, ignore=shutil.ignore_patterns('*.tmp'))
+		files = dict((k, v) for k, v in self.files.items() if not k.endswith('.tmp'))
+		self.assertEqual((report['files'], report['errors']), (3, []))
+		self.assertEqual(self.tree(self.dst), files)
+		copytree(os.path.join(self.src, 'top.txt'), self.dst) 	# file into a directory
+		self.assertTrue(os.path.isfile(os.path.join(self.dst, 'top.txt')))
+
+	@unittest.skipUnless(hasattr(os, 'mkfifo'), 'no fifo')
+	def test_special_file(self):
+		os.mkfifo(os.path.join(self.src, 'a/pipe'))
+		for sync in [False, True]:
+			report = copytree(self.src, self.dst, sync=sync) 	# used to block on the fifo
+			self.assertEqual([e[0] for e in report['errors']], [os.path.join(self.src, 'a', 'pipe')])
+			self.assertEqual(self.tree(self.dst), self.files)
+
+
+class TestEnumfn(TmpDirTestCase):
+	''' enumfn methods, enumfn_reserve and its lost-race retry '''
+	def test_methods(self):
+		path = os.path.join(self.tmpdir, 'out.csv')
+		self.assertEqual(enumfn(path), os.path.join(self.tmpdir, 'out_0.csv'))
+		for i in range(100):
+			self.write('out_%d.csv' %i, b'')
+		self.write('out_150.csv', b'')
+		for method, n in [('linear', 100), ('probe', 100), ('scan', 151)]:
+			self.assertEqual(enumfn(path, method=method), os.path.join(self.tmpdir, 'out_%d.csv' %n))
+			self.assertEqual(enumfn(path, 200, method), os.path.join(self.tmpdir, 'out_200.csv'))
+		os.remove(os.path.join(self.tmpdir, 'out_40.csv'))
+		self.assertEqual(enumfn(path), os.path.join(self.tmpdir, 'out_40.csv'))
+
+	def test_reserve_lost_race(self):
+		''' another worker creates the chosen name between the search and os.open '''
+		from unittest import mock
+		import lib_general
+
+		path = self.tmpdir + os.sep + os.sep + 'out.txt' 	# not normalized
+		for i in range(3):
+			self.write('out_%d.txt' %i, b'')
+		os_open = os.open
+		lost = []
+
+		def racing_open(filename, flags, *args):
+			if not lost:
+				lost.append(filename)
+				os.close(os_open(filename, os.O_CREAT | os.O_WRONLY))
+			return os_open(filename, flags, *args)
+
+		with mock.patch.object(lib_general.os, 'open', side_effect=racing_open):
+			filename = enumfn_reserve(path)
+		self.assertEqual(os.path.basename(lost[0]), 'out_3.txt')
+		self.assertEqual(os.path.basename(filename), 'out_4.txt')
+		self.assertTrue(os.path.isfile(filename))
+		self.assertEqual(os.path.basename(enumfn_reserve(path)), 'out_5.txt')
+
+	def test_reserve_parallel(self):
+		import concurrent.futures
+		path = os.path.join(self.tmpdir, 'out.txt')
+		with concurrent.futures.ProcessPoolExecutor(4) as pool:
+			names = list(pool.map(enumfn_reserve, [path] * 100))
+		self.assertEqual(sorted(names), sorted(os.path.join(self.tmpdir, 'out_%d.txt' %i) for i in range(100)))
+
+
+class TestSourceSh(TmpDirTestCase):
+	''' source_sh: env -0 capture and the cache (no shell on repeat calls) '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.environ = dict(os.environ)
+		os.environ['LIB_GENERAL_TEST_UNSET'] = '1'
+		self.script = self.write('setup.sh', b'export PATH=/opt/x/bin:$PATH\n'
+							b'export MULTI="line1\nline2=x"\nunset LIB_GENERAL_TEST_UNSET\necho noise\n')
+		import lib_general
+		lib_general._SOURCE_SH_CACHE.clear()
+
+	def tearDown(self):
+		os.environ.clear()
+		os.environ.update(self.environ)
+		TmpDirTestCase.tearDown(self)
+
+	def count_shells(self, func, *args, **kwargs):
+		''' run func, return (its output, number of shells started) '''
+		from unittest import mock
+		import lib_general
+		with mock.patch.object(lib_general.subprocess, 'run', wraps=subprocess.run) as run:
+			out = func(*args, **kwargs)
+		return out, run.call_count
+
+	def test_capture(self):
+		path = os.environ['PATH']
+		diff = source_sh(self.script, cache=False)
+		self.assertEqual(diff, {'PATH' : '/opt/x/bin:' + path, 'MULTI' : 'line1\nline2=x',
+								'LIB_GENERAL_TEST_UNSET' : None})
+		self.assertEqual(os.environ['MULTI'], 'line1\nline2=x')
+		self.assertFalse('LIB_GENERAL_TEST_UNSET' in os.environ)
+
+	def test_repeat_calls_start_no_shell(self):
+		path = os.environ['PATH']
+		_, n_shells = self.count_shells(source_sh, self.script)
+		self.assertEqual(n_shells, 1)
+		for _ in range(5):
+			diff, n_shells = self.count_shells(source_sh, self.script)
+			self.assertEqual(n_shells, 0)
+		self.assertEqual(os.environ['PATH'], '/opt/x/bin:' + path) 	# prefixed once
+		self.assertEqual(diff['PATH'], '/opt/x/bin:' + path)
+
+		os.environ['LIB_GENERAL_TEST_UNSET'] = '1' 	# back to the state before: cached too
+		os.environ['PATH'] = path
+		_, n_shells = self.count_shells(source_sh, self.script)
+		self.assertEqual(n_shells, 0)
+		os.environ['OTHER_VAR'] = 'changed' 		# another input environment
+		_, n_shells = self.count_shells(source_sh, self.script)
+		self.assertEqual(n_shells, 1)
+		os.environ['PATH'] = path + ':/somewhere/else' 	# PATH the script did not produce
+		_, n_shells = self.count_shells(source_sh, self.script)
+		self.assertEqual(n_shells, 1)
+		self.assertEqual(os.environ['PATH'], '/opt/x/bin:' + path + ':/somewhere/else')
+
+		with open(self.script, 'a') as f: 			# script changed
+			f.write('export NEW=1\n')
+		os.utime(self.script, ns=(0, 10**18))
+		diff, n_shells = self.count_shells(source_sh, self.script)
+		self.assertEqual((n_shells, diff.get('NEW')), (1, '1'))
+
+	def test_disk_cache(self):
+		import lib_general
+		cachedir = os.path.join(self.tmpdir, 'cache')
+		source_sh(self.script, cachedir=cachedir)
+		lib_general._SOURCE_SH_CACHE.clear()
+		_, n_shells = self.count_shells(source_sh, self.script, cachedir=cachedir)
+		self.assertEqual(n_shells, 0)
+
+	def test_bounded(self):
+		import lib_general
+		for i in range(lib_general._SOURCE_SH_SIZE + 10):
+			source_sh(self.write('s%d.sh' %i, b'export V%d=1\n' %i))
+		self.assertEqual(len(lib_general._SOURCE_SH_CACHE), lib_general._SOURCE_SH_SIZE)
+		self.assertEqual(len(lib_general._SOURCE_SH_HASH), lib_general._SOURCE_SH_SIZE)
+		for i in range(lib_general._SOURCE_SH_ENTRIES + 5):
+			os.environ['OTHER_VAR'] = str(i)
+			source_sh(self.script)
+		key = lib_general._source_sh_key(self.script, 'bash')
+		self.assertEqual(len(lib_general._SOURCE_SH_CACHE[key]), lib_general._SOURCE_SH_ENTRIES)
+
+	def test_errors(self):
+		with self.assertRaises(subprocess.CalledProcessError):
+			source_sh(self.write('bad.sh', b'exit 3\n'))
+		with self.assertRaises(subprocess.TimeoutExpired):
+			source_sh(self.write('slow.sh', b'sleep 5\n'), timeout_sec=0.2)
+
+	def test_exit_in_script(self):
+		import lib_general
+		environ = dict(os.environ)
+		for data in [b'export A=1\nexit 0\n', b'exit\n']:
+			script = self.write('exit.sh', data)
+			with self.assertRaises(subprocess.CalledProcessError):
+				source_sh(script)
+			self.assertEqual(dict(os.environ), environ) 	# nothing applied
+		self.assertFalse(lib_general._SOURCE_SH_CACHE.get(lib_general._source_sh_key(script, 'bash'))) 	# nothing cached
+
+
+class TestShellWorker(TmpDirTestCase):
+	''' ShellWorker: startup output, pipelining, timeout and restart '''
+	def setUp(self):
+		TmpDirTestCase.setUp(self)
+		self.environ = dict(os.environ)
+		os.environ['BASH_ENV'] = self.write('bashenv.sh', 	# sourced at startup of bash -s
+							b'echo banner\nprintf "JUNK=1\\000=x\\001\\002"\n')
+		self.worker = ShellWorker()
+
+	def tearDown(self):
+		self.worker.close()
+		os.environ.clear()
+		os.environ.update(self.environ)
+		TmpDirTestCase.tearDown(self)
+
+	def test_startup_output_dropped(self):
+		self.assertFalse('JUNK' in self.worker._base)
+		self.assertFalse(any('banner' in k for k in self.worker._base))
+		self.assertEqual(self.worker._base.get('PATH'), os.environ['PATH'])
+		diff = self.worker.source(self.write('a.sh', b'export A=1\necho noise\n'))
+		self.assertEqual(diff, {'A' : '1'})
+
+	def test_pipelining(self):
+		paths = [self.write('s%d.sh' %i, b'export V=%d\n' %i) for i in range(20)]
+		paths.insert(5, self.write('bad.sh', b'exit 3\n'))
+		out = self.worker.source_many(paths, pipeline=4, return_exceptions=True)
+		self.assertEqual(len(out), 21)
+		self.assertIsInstance(out[5], subprocess.CalledProcessError)
+		self.assertEqual([d['V'] for d in out[:5] + out[6:]], [str(i) for i in range(20)])
+		with self.assertRaises(subprocess.CalledProcessError):
+			self.worker.source_many(paths, pipeline=4)
+		self.assertEqual(self.worker.source(paths[0]), {'V' : '0'}) 	# still in sync
+
+	def test_exit_in_script(self):
+		for data in [b'export A=1\nexit 0\n', b'exit\n']:
+			with self.assertRaises(subprocess.CalledProcessError):
+				self.worker.source(self.write('exit.sh', data))
+		self.assertEqual(self.worker.source(self.write('a.sh', b'export A=1\n')), {'A' : '1'})
+
+	def test_timeout_restarts(self):
+		with self.assertRaises(subprocess.TimeoutExpired):
+			self.worker.source(self.write('slow.sh', b'sleep 5\n'), timeout_sec=0.2)
+		self.assertEqual(self.worker.source(self.write('a.sh', b'export A=1\n')), {'A' : '1'})
+
+	def test_crash_restarts(self):
+		self.worker._proc.kill()
+		self.worker._proc.wait()
+		self.assertEqual(self.worker.source(self.write('a.sh', b'export A=1\n')), {'A' : '1'})
+		with self.assertRaises(ChildProcessError): 		# the script kills the shell
+			self.worker.source(self.write('kill.sh', b'kill -9 $$\n'))
+		self.assertEqual(self.worker.source(self.write('b.sh', b'export B=1\n')), {'B' : '1'})
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+
+#=========================================================================================
+# 									VERSION CHANGE
+#=========================================================================================
+# 17 Oct 2026	| V 0.1.0	|	First version, line-offset index
+# 17 Oct 2026	| V 0.2.0	|	splitfile
+# 17 Oct 2026	| V 0.3.0	|	compression detection
+# 17 Oct 2026	| V 0.4.0	|	tail_lines
+# 17 Oct 2026	| V 0.5.0	|	copytree, sync mode
+# 17 Oct 2026	| V 0.6.0	|	enumfn, enumfn_reserve
+# 17 Oct 2026	| V 0.7.0	|	source_sh and its cache
+# 17 Oct 2026	| V 0.8.0	|	ShellWorker
+# 17 Oct 2026	| V 0.8.1	|	source_sh with a script that exits the shell
+# 17 Oct 2026	| V 0.8.2	|	ShellWorker with a script that exits the subshell
+# 17 Oct 2026	| V 0.8.3	|	tail_lines of a file growing while read
+# 17 Oct 2026	| V 0.8.4	|	copytree with a fifo in the tree
+# 17 Oct 2026	| V 0.8.5	|	partitionfile
+# 17 Oct 2026	| V 0.8.6	|	searchpath, searchpath_iter
+# 17 Oct 2026	| V 0.8.7	|	PathIndex
+# 17 Oct 2026	| V 0.8.8	|	grep_files
+# 17 Oct 2026	| V 0.8.9	|	readinto_chunks
+# 17 Oct 2026	| V 0.8.10	|	aread_in_chunks
+#=========================================================================================